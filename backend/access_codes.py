@@ -0,0 +1,153 @@
+import os
+import asyncio
+import logging
+import secrets
+from typing import Optional
+
+from backend.prisma_client import Prisma
+from backend.prisma_db import db
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+ACCESS_CODE_TTL_SECONDS = int(os.getenv("ACCESS_CODE_TTL_SECONDS", "86400"))
+ACCESS_CODE_SWEEP_SECONDS = float(os.getenv("ACCESS_CODE_SWEEP_SECONDS", "300"))
+ACCESS_CODE_SWEEP_BATCH = int(os.getenv("ACCESS_CODE_SWEEP_BATCH", "1000"))
+ISSUE_ATTEMPTS = 5
+
+# Outstanding codes are doctor_patient rows with no doctor yet. The sweeper
+# and the reuse lookup only ever look at those.
+_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS idx_doctor_patient_outstanding_codes "
+    "ON doctor_patient (patient_id, expires_at) WHERE doctor_id IS NULL",
+)
+
+# Returns the patient's newest code with at least half its lifetime left, so
+# a reused code doesn't expire before the doctor gets to it, or inserts a new
+# one if there is none, in one round trip. A code that collides with an
+# existing one inserts nothing and is retried with another.
+_ISSUE_SQL = """
+WITH outstanding AS (
+    SELECT access_code, expires_at FROM doctor_patient
+    WHERE patient_id = $1 AND doctor_id IS NULL AND expires_at > now() + make_interval(secs => $3 / 2)
+    ORDER BY expires_at DESC
+    LIMIT 1
+), issued AS (
+    INSERT INTO doctor_patient (patient_id, access_code, expires_at, created_at)
+    SELECT $1, $2, now() + make_interval(secs => $3), now()
+    WHERE NOT EXISTS (SELECT 1 FROM outstanding)
+    ON CONFLICT (access_code) DO NOTHING
+    RETURNING access_code, expires_at
+)
+SELECT access_code, expires_at FROM outstanding
+UNION ALL
+SELECT access_code, expires_at FROM issued
+"""
+
+# The claim is a single conditional UPDATE, so two doctors racing for the
+# same code can't both win. The code is cleared once used.
+_CLAIM_SQL = """
+UPDATE doctor_patient
+SET doctor_id = $2, access_code = NULL, expires_at = NULL
+WHERE access_code = $1 AND doctor_id IS NULL AND expires_at > now()
+RETURNING patient_id
+"""
+
+# Codes issued before expiry was tracked have no expires_at and are swept too.
+_SWEEP_SQL = """
+DELETE FROM doctor_patient
+WHERE id IN (
+    SELECT id FROM doctor_patient
+    WHERE doctor_id IS NULL AND (expires_at IS NULL OR expires_at <= now())
+    LIMIT $1
+)
+"""
+
+
+async def ensure_indexes(db: Prisma) -> None:
+    for ddl in _INDEX_DDL:
+        await db.execute_raw(ddl)
+
+
+def normalize(access_code: str) -> str:
+    return access_code.strip().upper()
+
+
+async def issue(db: Prisma, patient_id: int, ttl: int = ACCESS_CODE_TTL_SECONDS) -> dict:
+    """
+    The patient's outstanding access code if it has at least ttl / 2
+    seconds left, or a new one valid for ttl seconds. Returns access_code
+    and expires_at.
+    """
+    for _ in range(ISSUE_ATTEMPTS):
+        rows = await db.query_raw(_ISSUE_SQL, patient_id, secrets.token_hex(3).upper(), ttl)
+        if rows:
+            return rows[0]
+    raise RuntimeError("Could not generate a unique access code")
+
+
+async def claim(db: Prisma, access_code: str, doctor_id: int) -> Optional[int]:
+    """
+    Links doctor_id through an unclaimed, unexpired code. Returns the
+    patient's id, or None if the code can't be used.
+    """
+    rows = await db.query_raw(_CLAIM_SQL, normalize(access_code), doctor_id)
+    return rows[0]['patient_id'] if rows else None
+
+
+class AccessCodeSweeper:
+    """
+    Periodically deletes expired, unclaimed codes in batches, so each
+    DELETE stays short however many have piled up.
+    """
+
+    def __init__(self, db: Prisma, interval: float = ACCESS_CODE_SWEEP_SECONDS,
+                 batch_size: int = ACCESS_CODE_SWEEP_BATCH):
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.swept = 0
+        self.runs = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def sweep(self) -> int:
+        total = 0
+        while True:
+            count = await self.db.execute_raw(_SWEEP_SQL, self.batch_size)
+            total += count
+            if count < self.batch_size:
+                break
+            # Let other queries in between batches.
+            await asyncio.sleep(0)
+        self.swept += total
+        self.runs += 1
+        if total:
+            logger.info("Deleted %d expired access codes", total)
+        return total
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to sweep expired access codes")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {'swept': self.swept, 'runs': self.runs}
+
+
+access_code_sweeper = AccessCodeSweeper(db)
+metrics.register("access_code_sweeper", access_code_sweeper.stats)
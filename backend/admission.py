@@ -0,0 +1,113 @@
+import math
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, status
+
+from backend.prisma_client import Prisma
+
+_BACKLOG_SQL = """
+SELECT count(*)::int AS total,
+       count(*) FILTER (WHERE d.patient_id = $1)::int AS patient
+FROM analysis_jobs j
+JOIN medical_documents d ON d.id = j.document_id
+WHERE j.status IN ('queued', 'running')
+"""
+
+
+class AdmissionController:
+    """
+    Bounds the analysis backlog. Uploads are admitted only while the number
+    of queued and running analysis jobs, overall and for the uploading
+    patient, stays within budget; beyond that they fail fast with 429 and a
+    Retry-After estimated from how long analyses have recently taken.
+
+    Admissions that have been granted but not yet enqueued are counted too,
+    so concurrent uploads on this process can't overshoot the budget.
+    """
+
+    def __init__(self, queue_limit: int, patient_queue_limit: int, workers: int, patient_workers: int,
+                 initial_service_seconds: float = 5.0, smoothing: float = 0.2):
+        self.queue_limit = queue_limit
+        self.patient_queue_limit = patient_queue_limit
+        self.workers = workers
+        self.patient_workers = patient_workers
+        self.smoothing = smoothing
+        self.service_seconds = initial_service_seconds
+        self._reserved = 0
+        self._reserved_by_patient: dict = {}
+        self._stats = {
+            'admitted': 0,
+            'rejected_global': 0,
+            'rejected_patient': 0,
+            'queue_depth': 0,
+            'completed': 0,
+        }
+
+    def observe(self, seconds: float) -> None:
+        """
+        Records how long one analysis took (exponentially weighted).
+        """
+        self.service_seconds += self.smoothing * (seconds - self.service_seconds)
+        self._stats['completed'] += 1
+
+    def retry_after(self, excess: int, parallelism: int) -> int:
+        """
+        Seconds until roughly excess jobs have drained at parallelism.
+        """
+        seconds = math.ceil(max(excess, 1) * self.service_seconds / max(parallelism, 1))
+        return min(max(seconds, 1), 300)
+
+    def _reject(self, kind: str, detail: str, retry_after: int) -> None:
+        self._stats[f'rejected_{kind}'] += 1
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    @asynccontextmanager
+    async def admit(self, db: Prisma, patient_id: int, count: int = 1):
+        """
+        Reserves room for count analyses for the duration of the block, in
+        which the caller enqueues them. Raises 429 if there is no room.
+        """
+        rows = await db.query_raw(_BACKLOG_SQL, patient_id)
+        total = rows[0]['total'] + self._reserved
+        patient = rows[0]['patient'] + self._reserved_by_patient.get(patient_id, 0)
+        self._stats['queue_depth'] = rows[0]['total']
+
+        excess = total + count - self.queue_limit
+        if excess > 0:
+            self._reject(
+                'global', "The analysis queue is full, please retry later",
+                self.retry_after(excess, self.workers),
+            )
+        excess = patient + count - self.patient_queue_limit
+        if excess > 0:
+            self._reject(
+                'patient',
+                f"You have {patient} documents waiting for analysis, please retry later",
+                self.retry_after(excess, min(self.patient_workers, self.workers)),
+            )
+
+        self._stats['admitted'] += count
+        self._reserved += count
+        self._reserved_by_patient[patient_id] = self._reserved_by_patient.get(patient_id, 0) + count
+        try:
+            yield
+        finally:
+            self._reserved -= count
+            remaining = self._reserved_by_patient[patient_id] - count
+            if remaining:
+                self._reserved_by_patient[patient_id] = remaining
+            else:
+                del self._reserved_by_patient[patient_id]
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            'reserved': self._reserved,
+            'queue_limit': self.queue_limit,
+            'patient_queue_limit': self.patient_queue_limit,
+            'service_seconds': round(self.service_seconds, 3),
+        }
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from backend.auth import require_role
+from backend.schemas import User
+from backend import metrics
+from backend.backfill import (
+    BACKFILL_BATCH_SIZE, BACKFILL_CONCURRENCY, BACKFILL_RATE, BackfillBusy, backfill_runner,
+)
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics(current_user: User = Depends(require_role("admin"))):
+    """
+    Returns a snapshot of in-process component stats (batchers, caches, queues).
+    """
+    return metrics.snapshot()
+
+
+@router.get("/backfill")
+async def get_backfill_status(current_user: User = Depends(require_role("admin"))):
+    """
+    Progress, throughput and ETA of this process's re-analysis backfill.
+    """
+    return backfill_runner.stats()
+
+
+@router.post("/backfill", status_code=status.HTTP_202_ACCEPTED)
+async def start_backfill(
+    rate: float = Query(BACKFILL_RATE, ge=0, description="Documents started per second, 0 for no limit"),
+    concurrency: int = Query(BACKFILL_CONCURRENCY, ge=1, le=32),
+    batch_size: int = Query(BACKFILL_BATCH_SIZE, ge=1, le=1000),
+    current_user: User = Depends(require_role("admin")),
+):
+    """
+    Starts (or resumes) re-analysing documents stored with an older pipeline
+    version, in the background.
+    """
+    try:
+        await backfill_runner.start(rate=rate, concurrency=concurrency, batch_size=batch_size)
+    except BackfillBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return backfill_runner.stats()
+
+
+@router.post("/backfill/stop")
+async def stop_backfill(current_user: User = Depends(require_role("admin"))):
+    """
+    Stops the backfill after its current batch; it can be resumed later.
+    """
+    await backfill_runner.stop()
+    return backfill_runner.stats()
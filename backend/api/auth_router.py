@@ -28,7 +28,7 @@ async def login_for_access_token(
         return {"access_token": access_token, "token_type": "bearer"}
 
     user = await auth.get_user(db, email=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    if not user or not await auth.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -60,10 +60,11 @@ async def google_login(request: GoogleLoginRequest, db: Prisma = Depends(get_db)
             data={
                 'email': email,
                 'name': name,
-                'hashed_password': auth.get_password_hash(user_info['sub']),
+                'hashed_password': await auth.get_password_hash_async(user_info['sub']),
                 'role': 'patient'
             }
         )
+        auth.invalidate_principal(user.email)
     else:
         if user.role != 'patient':
             raise HTTPException(
@@ -92,7 +93,7 @@ async def register_user(user: schemas.UserCreate, db: Prisma = Depends(get_db)):
             status_code=400, detail="Email already registered"
         )
     
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await auth.get_password_hash_async(user.password)
     
     db_user = await db.user.create(
         data={
@@ -102,4 +103,5 @@ async def register_user(user: schemas.UserCreate, db: Prisma = Depends(get_db)):
             'role': user.role
         }
     )
+    auth.invalidate_principal(db_user.email)
     return db_user
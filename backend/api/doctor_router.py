@@ -1,19 +1,68 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from backend.auth import get_current_user
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from backend.auth import get_current_user, get_stream_user
 from backend.prisma_db import get_db
-from backend.schemas import User, DocumentDetail
+from backend.schemas import (
+    User, DocumentDetail, DocumentSummary, PatientSummary, SearchHit, TimelineAggregate, TimelineEntry,
+)
 from backend.prisma_client import Prisma
+from backend.events import event_stream
+from backend.file_serving import document_response, signed_file_url
+from backend.patient_links import patient_links, require_patient_link
+from backend import documents as document_queries, export, search_index, timeline
+from backend.renditions import RENDITION_SIZES, supported as rendition_supported
 
 router = APIRouter()
 
-@router.get("/patients", response_model=List[User])
+# Pages through a doctor's linked patients by id. The page is cut first and
+# document stats are computed only for the rows on it.
+_ROSTER_SQL = """
+WITH page AS (
+    SELECT u.id, u.email, u.name, u.role::text AS role
+    FROM users u
+    WHERE EXISTS (
+        SELECT 1 FROM doctor_patient dp
+        WHERE dp.doctor_id = $1 AND dp.patient_id = u.id
+    )
+      AND u.id > $2
+      AND ($3::text IS NULL OR u.name ILIKE $3 OR u.email ILIKE $3)
+    ORDER BY u.id
+    LIMIT $4
+)
+SELECT page.id, page.email, page.name, page.role,
+       COALESCE(stats.document_count, 0)::int AS document_count,
+       stats.latest_upload
+FROM page
+LEFT JOIN LATERAL (
+    SELECT COUNT(*) AS document_count, MAX(d.upload_timestamp) AS latest_upload
+    FROM medical_documents d
+    WHERE d.patient_id = page.id
+) stats ON true
+ORDER BY page.id
+"""
+
+
+def _prefix_pattern(prefix: Optional[str]) -> Optional[str]:
+    if not prefix:
+        return None
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"{escaped}%"
+
+
+@router.get("/patients", response_model=List[PatientSummary])
 async def get_doctor_patients(
+    response: Response,
+    cursor: int = Query(0, ge=0, description="Return patients with id greater than this"),
+    limit: int = Query(100, ge=1, le=500),
+    search: Optional[str] = Query(None, description="Name or email prefix"),
     db: Prisma = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """
-    Retrieves a list of all patients assigned to the current doctor.
+    Retrieves a page of the patients assigned to the current doctor, with
+    document counts. When more remain, X-Next-Cursor holds the cursor for
+    the next page.
     """
     if current_user.role != 'doctor':
         raise HTTPException(
@@ -21,15 +70,29 @@ async def get_doctor_patients(
             detail="Only doctors can view patients",
         )
 
-    patient_links = await db.doctorpatient.find_many(
-        where={'doctor_id': current_user.id}
+    rows = await db.query_raw(
+        _ROSTER_SQL, current_user.id, cursor, _prefix_pattern(search), limit
     )
-    patient_ids = [link.patient_id for link in patient_links]
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1]['id'])
+    return rows
+
+
+def _document_urls(row: dict) -> dict:
+    """
+    Signed download links for a document row and its renditions.
+    """
+    if not row['file_path']:
+        return {'file_url': "", 'renditions': {}}
+    filename = row['filename']
+    return {
+        'file_url': signed_file_url(row['id'], row['content_hash'], filename),
+        'renditions': {
+            kind: signed_file_url(row['id'], row['content_hash'], filename, rendition=kind)
+            for kind in RENDITION_SIZES
+        } if rendition_supported(filename) else {},
+    }
 
-    patients = await db.user.find_many(
-        where={'id': {'in': patient_ids}}
-    )
-    return patients
 
 @router.get("/patients/{patient_id}/documents", response_model=List[DocumentDetail])
 async def get_patient_documents_for_doctor(
@@ -40,38 +103,165 @@ async def get_patient_documents_for_doctor(
     """
     Retrieves all documents for a specific patient, accessible by a doctor.
     """
-    if current_user.role != 'doctor':
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only doctors can view patient documents",
-        )
+    await require_patient_link(db, current_user, patient_id)
+    return await document_queries.documents_response(db, patient_id, _document_urls)
+
+
+@router.get(
+    "/patients/{patient_id}/documents/stream",
+    response_class=StreamingResponse,
+    responses=document_queries.ndjson_responses("DocumentDetail"),
+)
+async def stream_patient_documents_for_doctor(
+    patient_id: int,
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    The same documents as /patients/{patient_id}/documents, as NDJSON.
+    """
+    await require_patient_link(db, current_user, patient_id)
+    return document_queries.documents_stream(db, patient_id, _document_urls)
+
+
+@router.get("/patients/{patient_id}/export")
+async def export_patient_record(
+    patient_id: int,
+    cursor: int = Query(0, ge=0, description="Export documents with id greater than this"),
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Streams a ZIP of the patient's document files with consolidated
+    analyses.json and analyses.csv. Large histories come in parts; when more
+    remain, X-Next-Cursor holds the cursor for the next part.
+    """
+    await require_patient_link(db, current_user, patient_id)
+    return await export.export_response(db, patient_id, cursor)
+
+
+@router.get("/patients/{patient_id}/documents/summary", response_model=List[DocumentSummary])
+async def get_patient_document_summaries_for_doctor(
+    patient_id: int,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Lists a linked patient's documents newest first without analysis payloads.
+    """
+    await require_patient_link(db, current_user, patient_id)
+    return await document_queries.list_document_summaries(db, response, patient_id, cursor, limit)
+
+@router.get("/patients/{patient_id}/documents/{document_id}/analysis")
+async def get_patient_document_analysis_for_doctor(
+    patient_id: int,
+    document_id: int,
+    request: Request,
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    await require_patient_link(db, current_user, patient_id)
+    return await document_queries.analysis_response(db, request, document_id, patient_id)
 
-    link = await db.doctorpatient.find_first(
+
+@router.get("/patients/{patient_id}/documents/{document_id}/file")
+async def download_patient_document_for_doctor(
+    patient_id: int,
+    document_id: int,
+    request: Request,
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    await require_patient_link(db, current_user, patient_id)
+
+    document = await db.medicaldocument.find_first(
         where={
-            'doctor_id': current_user.id,
+            'id': document_id,
             'patient_id': patient_id,
         }
     )
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+
+    return await document_response(request, document)
+
+
+@router.get("/patients/{patient_id}/timeline", response_model=List[TimelineEntry])
+async def get_patient_timeline(
+    patient_id: int,
+    response: Response,
+    entity_type: Optional[str] = Query(None, description="e.g. MEDICATION"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Clinical entities extracted from a linked patient's documents, oldest first.
+    """
+    await require_patient_link(db, current_user, patient_id)
+    return await timeline.list_entries(
+        db, response, patient_id, entity_type.upper() if entity_type else None, cursor, limit
+    )
+
+
+@router.get("/patients/{patient_id}/timeline/summary", response_model=List[TimelineAggregate])
+async def get_patient_timeline_summary(
+    patient_id: int,
+    entity_type: Optional[str] = Query(None, description="e.g. MEDICATION"),
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    One row per distinct entity: when it was first and last seen and how often.
+    """
+    await require_patient_link(db, current_user, patient_id)
+    return await timeline.aggregate(db, patient_id, entity_type.upper() if entity_type else None)
+
 
-    if not link:
+@router.get("/search", response_model=List[SearchHit])
+async def search_patient_documents(
+    q: Optional[str] = Query(None, description="Full-text query over OCR text, summaries and entities"),
+    entity: Optional[str] = Query(None, description="Exact entity, e.g. Amoxicillin"),
+    label: Optional[str] = Query(None, description="Restrict entity to a label, e.g. MEDICATION"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Searches the documents of every patient linked to the current doctor.
+    Matches in the text are wrapped in <mark> in each hit's highlight.
+    """
+    if current_user.role != 'doctor':
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="You do not have access to this patient's documents",
+            detail="Only doctors can search patient documents",
         )
 
-    documents = await db.medicaldocument.find_many(
-        where={'patient_id': patient_id}
-    )
-    
-    return [
-        DocumentDetail(
-            id=doc.id,
-            filename=doc.file_path.split('/')[-1] if doc.file_path else "N/A",
-            file_url=f"/uploads/{doc.file_path.split('/')[-1]}" if doc.file_path else "",
-            upload_timestamp=doc.upload_timestamp,
-            ai_analysis=doc.ai_analysis_json,
-            analysis_status="processed" if doc.ai_analysis_json else "pending",
+    if not q and not entity:
+        raise HTTPException(status_code=400, detail="Provide a query or an entity to search for")
+
+    entity_key = search_index.entity_key(entity, label) if entity else None
+    patient_ids = await patient_links.patient_ids(db, current_user.id)
+    return await search_index.search(db, patient_ids, q or None, entity_key, limit, offset)
+
+
+@router.get("/events")
+async def stream_document_events(current_user: User = Depends(get_stream_user)):
+    """
+    Server-Sent Events stream of analysis progress for linked patients' documents.
+    """
+    if current_user.role != 'doctor':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only doctors can subscribe to patient document events",
         )
-        for doc in documents
-    ]
 
+    return event_stream(current_user.id)
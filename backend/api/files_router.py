@@ -0,0 +1,55 @@
+from pathlib import Path
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from backend.prisma_db import get_db
+from backend.prisma_client import Prisma
+from backend.file_serving import blob_response, file_response, verify_file_signature
+from backend import blob_store
+from backend.renditions import ensure_rendition
+
+router = APIRouter()
+
+
+@router.get("/{document_id}")
+async def get_signed_file(
+    document_id: int,
+    request: Request,
+    expires: int,
+    signature: str,
+    h: str = "",
+    name: str = "",
+    rendition: str = "",
+    db: Prisma = Depends(get_db),
+):
+    """
+    Serves a document through a URL from signed_file_url(). The signature
+    stands in for authentication, so content-addressed files need no query.
+    """
+    verify_file_signature(document_id, h, name, rendition, expires, signature)
+
+    file_path = None
+    if h:
+        if not rendition:
+            return await blob_response(request, h, name)
+    else:
+        document = await db.medicaldocument.find_unique(where={'id': document_id})
+        if not document:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found"
+            )
+        if not rendition:
+            return await file_response(request, Path(document.file_path), name, None)
+        file_path = document.file_path
+
+    # Renditions are derived files kept next to the local copy of the original.
+    try:
+        async with blob_store.local_file(h, file_path) as path:
+            rendered = await ensure_rendition(path, rendition)
+    except FileNotFoundError:
+        rendered = None
+    if rendered is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No rendition available for this document"
+        )
+    return await file_response(request, rendered, f"{name}.{rendition}.jpg", None)
@@ -1,9 +1,10 @@
-import secrets
 from fastapi import APIRouter, Depends, HTTPException, status
 from backend.auth import get_current_user
 from backend.prisma_db import get_db
 from backend.schemas import User
 from backend.prisma_client import Prisma
+from backend.patient_links import patient_links
+from backend import access_codes
 
 router = APIRouter(
     tags=["linking"],
@@ -17,16 +18,9 @@ async def generate_access_code(current_user: User = Depends(get_current_user), d
             detail="Only patients can generate access codes",
         )
 
-    access_code = secrets.token_hex(3).upper()
+    issued = await access_codes.issue(db, current_user.id)
 
-    await db.doctorpatient.create(
-        data={
-            'patient_id': current_user.id,
-            'access_code': access_code,
-        }
-    )
-
-    return {"access_code": access_code}
+    return {"access_code": issued['access_code'], "expires_at": issued['expires_at']}
 
 @router.post("/doctor/link-patient", status_code=status.HTTP_200_OK)
 async def link_patient(access_code: str, current_user: User = Depends(get_current_user), db: Prisma = Depends(get_db)):
@@ -36,17 +30,33 @@ async def link_patient(access_code: str, current_user: User = Depends(get_curren
             detail="Only doctors can link with patients",
         )
 
-    link_request = await db.doctorpatient.find_unique(where={'access_code': access_code})
+    patient_id = await access_codes.claim(db, access_code, current_user.id)
 
-    if not link_request or link_request.doctor_id is not None:
+    if patient_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Invalid or already used access code",
+            detail="Invalid, expired or already used access code",
         )
+    patient_links.invalidate(current_user.id)
+
+    return {"message": "Patient linked successfully"}
 
-    await db.doctorpatient.update(
-        where={'access_code': access_code},
-        data={'doctor_id': current_user.id}
+@router.delete("/doctor/patients/{patient_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def unlink_patient(patient_id: int, current_user: User = Depends(get_current_user), db: Prisma = Depends(get_db)):
+    if current_user.role != 'doctor':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only doctors can unlink patients",
+        )
+
+    removed = await db.doctorpatient.delete_many(
+        where={'doctor_id': current_user.id, 'patient_id': patient_id}
     )
+    patient_links.invalidate(current_user.id)
 
-    return {"message": "Patient linked successfully"}
+    if not removed:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Patient is not linked to you",
+        )
+    return None
@@ -1,19 +1,23 @@
-from typing import List
-import shutil
+import os
 import asyncio
-import json
+import logging
+from typing import List, Optional
 from pathlib import Path
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
-from backend.auth import get_current_user
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from backend.auth import get_current_user, get_stream_user
 from backend.prisma_db import get_db
-from backend.schemas import User, DocumentInfo, DocumentDetail
+from backend.schemas import User, DocumentInfo, DocumentDetail, DocumentSummary, BatchUploadItem
 from backend.prisma_client import Prisma
-from backend import services
+from backend.events import event_stream
+from backend.file_serving import document_response
+from backend import jobs, blob_store, documents as document_queries
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-UPLOAD_DIR = Path("./uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "500"))
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "8"))
 
 
 @router.post("/upload/", response_model=DocumentInfo)
@@ -31,40 +35,107 @@ async def upload_document(
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
 
-    file_path = UPLOAD_DIR / file.filename
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    filename = Path(file.filename).name
+    async with jobs.admission.admit(db, current_user.id):
+        ingested = await blob_store.ingest(file)
+        try:
+            stored_key = await blob_store.commit(db, ingested)
+        except Exception:
+            await blob_store.discard(ingested)
+            raise
 
-    ocr_task = asyncio.create_task(services.mock_ocr_service(str(file_path)))
-    cv_task = asyncio.create_task(services.mock_cv_service(str(file_path)))
-
-    ocr_result = await ocr_task
-    nlp_task = asyncio.create_task(services.mock_nlp_service(ocr_result))
-
-    cv_result = await cv_task
-    nlp_result = await nlp_task
-
-    aggregated_analysis = {
-        "ocr_result": ocr_result,
-        "nlp_result": nlp_result,
-        "cv_result": cv_result,
-    }
-
-    db_document = await db.medicaldocument.create(
-        data={
-            'patient_id': current_user.id,
-            'file_path': str(file_path),
-            'ai_analysis_json': json.dumps(aggregated_analysis),
-        }
-    )
+        try:
+            db_document = await jobs.enqueue_analysis(
+                db, current_user.id, stored_key, filename, ingested.sha256
+            )
+        except Exception:
+            await blob_store.release(db, ingested.sha256)
+            raise
 
     return DocumentInfo(
         id=db_document.id,
-        filename=file.filename,
+        filename=filename,
         upload_timestamp=db_document.upload_timestamp,
         ai_analysis=db_document.ai_analysis_json,
+        analysis_status=db_document.analysis_status,
     )
 
+@router.post("/upload/batch", response_model=List[BatchUploadItem])
+async def upload_documents_batch(
+    files: List[UploadFile] = File(...),
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Uploads many files in one request. Files are stored concurrently and all
+    documents are inserted in one statement; a file that fails to store is
+    reported as failed without affecting the others. The whole batch is
+    refused with 429 if it doesn't fit in the analysis queue.
+    """
+    if current_user.role != 'patient':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only patients can upload documents",
+        )
+
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch may contain at most {MAX_BATCH_FILES} files",
+        )
+
+    async with jobs.admission.admit(db, current_user.id, len(files)):
+        slots = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+
+        async def store(file: UploadFile):
+            if not file.filename:
+                raise HTTPException(status_code=400, detail="No file provided")
+            async with slots:
+                ingested = await blob_store.ingest(file)
+                try:
+                    stored_key = await blob_store.commit(db, ingested)
+                except Exception:
+                    await blob_store.discard(ingested)
+                    raise
+            return ingested, stored_key
+
+        outcomes = await asyncio.gather(*(store(file) for file in files), return_exceptions=True)
+
+        results = []
+        stored = []
+        for file, outcome in zip(files, outcomes):
+            filename = Path(file.filename or "").name
+            if isinstance(outcome, BaseException):
+                if isinstance(outcome, HTTPException):
+                    error = outcome.detail
+                else:
+                    # Internal errors can name paths and drivers; they stay in the log.
+                    logger.error("Failed to store batch upload file %r", filename, exc_info=outcome)
+                    error = "Failed to store file"
+                results.append(BatchUploadItem(filename=filename, analysis_status="failed", error=error))
+                continue
+            ingested, stored_key = outcome
+            results.append(None)
+            stored.append((len(results) - 1, stored_key, filename, ingested.sha256))
+
+        try:
+            rows = await jobs.enqueue_analysis_batch(
+                db, current_user.id, [(path, name, sha) for _, path, name, sha in stored]
+            )
+        except Exception:
+            for _, _, _, sha in stored:
+                await blob_store.release(db, sha)
+            raise
+
+    for (index, _, _, _), row in zip(stored, rows):
+        results[index] = BatchUploadItem(
+            filename=row['filename'],
+            id=row['id'],
+            upload_timestamp=row['upload_timestamp'],
+            analysis_status=row['analysis_status'],
+        )
+    return results
+
 @router.get("/documents", response_model=List[DocumentInfo])
 async def get_own_documents(
     db: Prisma = Depends(get_db),
@@ -76,18 +147,95 @@ async def get_own_documents(
             detail="Only patients can view their documents",
         )
 
-    documents = await db.medicaldocument.find_many(
-        where={'patient_id': current_user.id}
+    return await document_queries.documents_response(db, current_user.id)
+
+
+@router.get(
+    "/documents/stream",
+    response_class=StreamingResponse,
+    responses=document_queries.ndjson_responses("DocumentInfo"),
+)
+async def stream_own_documents(
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    The same documents as /documents, as NDJSON: one document per line.
+    """
+    if current_user.role != 'patient':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only patients can view their documents",
+        )
+
+    return document_queries.documents_stream(db, current_user.id)
+
+
+@router.get("/documents/summary", response_model=List[DocumentSummary])
+async def get_own_document_summaries(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Lists the patient's documents newest first without analysis payloads.
+    """
+    if current_user.role != 'patient':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only patients can view their documents",
+        )
+
+    return await document_queries.list_document_summaries(
+        db, response, current_user.id, cursor, limit
     )
-    return [
-        DocumentInfo(
-            id=doc.id,
-            filename=doc.file_path.split('/')[-1],
-            upload_timestamp=doc.upload_timestamp,
-            ai_analysis=doc.ai_analysis_json,
+
+
+@router.get("/documents/{document_id}/analysis")
+async def get_own_document_analysis(
+    document_id: int,
+    request: Request,
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    if current_user.role != 'patient':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only patients can view their documents",
+        )
+
+    return await document_queries.analysis_response(db, request, document_id, current_user.id)
+
+
+@router.get("/documents/{document_id}/file")
+async def download_own_document(
+    document_id: int,
+    request: Request,
+    db: Prisma = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    if current_user.role != 'patient':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only patients can view their documents",
+        )
+
+    document = await db.medicaldocument.find_first(
+        where={
+            'id': document_id,
+            'patient_id': current_user.id
+        }
+    )
+
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
         )
-        for doc in documents
-    ]
+
+    return await document_response(request, document)
 
 
 @router.delete("/documents/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -115,16 +263,32 @@ async def delete_document(
             detail="Document not found"
         )
 
-    try:
-        file_path = Path(document.file_path)
-        if file_path.exists():
-            file_path.unlink()
-    except Exception as e:
-        print(f"Error deleting file: {e}")
-
     await db.medicaldocument.delete(
         where={'id': document_id}
     )
 
+    try:
+        if document.content_hash:
+            await blob_store.release(db, document.content_hash)
+        else:
+            file_path = Path(document.file_path)
+            if file_path.exists():
+                file_path.unlink()
+    except Exception:
+        logger.exception("Error deleting the file of document %d", document_id)
+
     return None
 
+
+@router.get("/events")
+async def stream_document_events(current_user: User = Depends(get_stream_user)):
+    """
+    Server-Sent Events stream of analysis progress for the patient's own documents.
+    """
+    if current_user.role != 'patient':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only patients can subscribe to document events",
+        )
+
+    return event_stream(current_user.id)
@@ -1,20 +1,61 @@
+import os
+import time
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 import bcrypt
 from backend.prisma_db import get_db
 from backend.prisma_client import Prisma
 
-from backend import schemas
+from backend import schemas, metrics
+from backend.cache import TTLCache
 
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token", auto_error=False)
+
+# bcrypt releases the GIL, so a small dedicated pool hashes in parallel
+# without competing with the default threadpool used by file I/O.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+_hash_stats = {'outstanding': 0, 'completed': 0, 'rejected': 0, 'busy_seconds': 0.0}
+metrics.register("password_hashing", lambda: dict(_hash_stats))
+PASSWORD_HASH_SECONDS = metrics.Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt calls, including time queued for the executor.",
+    ("operation",),
+)
+
+# Resolved users keyed by (token subject, token id), so authenticated
+# requests don't hit the users table on every call. Entries never outlive
+# the token's exp.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+# Bumped per email on invalidation, so a lookup that was already reading
+# the user doesn't cache what it read. Only needs to outlive such a lookup,
+# so it is bounded like the cache itself.
+_principal_generations = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+metrics.register("principal_cache", principal_cache.stats)
+PRINCIPAL_LOOKUPS = metrics.Counter(
+    "auth_principal_lookups_total",
+    "Authenticated requests by whether the user came from the principal cache.",
+    ("result",),
+)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -33,6 +74,42 @@ def get_password_hash(password: str) -> str:
     return hashed.decode('utf-8')
 
 
+async def _run_password_hasher(func, *args):
+    """
+    Runs a bcrypt call on the dedicated executor, refusing new work with 503
+    once PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT calls are pending.
+    """
+    if _hash_stats['outstanding'] >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT:
+        _hash_stats['rejected'] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    loop = asyncio.get_running_loop()
+    _hash_stats['outstanding'] += 1
+    started = loop.time()
+    try:
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        elapsed = loop.time() - started
+        _hash_stats['outstanding'] -= 1
+        _hash_stats['completed'] += 1
+        _hash_stats['busy_seconds'] += elapsed
+        PASSWORD_HASH_SECONDS.observe(elapsed, func.__name__)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password without blocking the event loop."""
+    return await _run_password_hasher(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password without blocking the event loop."""
+    return await _run_password_hasher(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -40,6 +117,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -48,9 +126,45 @@ async def get_user(db: Prisma, email: str):
     return await db.user.find_unique(where={'email': email})
 
 
+def invalidate_principal(email: str) -> None:
+    """
+    Drops every cached principal for email. Call after creating a user or
+    changing their role.
+    """
+    for key in principal_cache.keys():
+        if key[0] == email:
+            principal_cache.pop(key)
+    _principal_generations.set(email, _principal_generations.get(email, 0) + 1)
+
+
+def _cache_principal(key: tuple, user, expires_at, generation: int) -> None:
+    if generation != _principal_generations.get(key[0], 0):
+        return
+    ttl = PRINCIPAL_CACHE_TTL
+    if expires_at is not None:
+        ttl = min(ttl, expires_at - time.time())
+    principal_cache.set(key, user, ttl=ttl)
+
+
 async def get_current_user(
     db: Prisma = Depends(get_db), token: str = Depends(oauth2_scheme)
 ):
+    return await authenticate_token(db, token)
+
+
+async def get_stream_user(
+    db: Prisma = Depends(get_db),
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = Query(None),
+):
+    """
+    Like get_current_user, but also accepts the token as ?access_token=,
+    since browsers' EventSource cannot set an Authorization header.
+    """
+    return await authenticate_token(db, token or access_token or "")
+
+
+async def authenticate_token(db: Prisma, token: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -73,9 +187,18 @@ async def get_current_user(
             role=schemas.Role.admin
         )
     
+    cache_key = (token_data.email, payload.get("jti"))
+    user = principal_cache.get(cache_key)
+    if user is not None:
+        PRINCIPAL_LOOKUPS.inc('hit')
+        return user
+    PRINCIPAL_LOOKUPS.inc('miss')
+
+    generation = _principal_generations.get(token_data.email, 0)
     user = await get_user(db, email=token_data.email)
     if user is None:
         raise credentials_exception
+    _cache_principal(cache_key, user, payload.get("exp"), generation)
     return user
 
 
@@ -0,0 +1,325 @@
+import os
+import time
+import socket
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from backend.prisma_db import db
+from backend.prisma_client import Json, Prisma
+from backend.documents import parse_analysis
+from backend import services, blob_store, metrics
+from backend.jobs import record_analysis
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "100"))
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "2"))
+# Documents started per second; 0 disables the limit.
+BACKFILL_RATE = float(os.getenv("BACKFILL_RATE", "1"))
+# Live analysis jobs allowed to wait before the backfill pauses for them.
+BACKFILL_MAX_LIVE_BACKLOG = int(os.getenv("BACKFILL_MAX_LIVE_BACKLOG", "0"))
+BACKFILL_LEASE_SECONDS = int(os.getenv("BACKFILL_LEASE_SECONDS", "300"))
+
+# Rows written before analyses were stored as native JSON hold a
+# JSON-encoded string, so the version is looked up in both shapes.
+_STALE_FILTER = """
+    analysis_status = 'processed'
+    AND COALESCE(
+        ai_analysis_json ->> 'pipeline_version',
+        (ai_analysis_json #>> '{}')::jsonb ->> 'pipeline_version'
+    ) IS DISTINCT FROM $2
+"""
+
+_NEXT_BATCH_SQL = f"""
+SELECT id FROM medical_documents
+WHERE id > $1 AND {_STALE_FILTER}
+ORDER BY id
+LIMIT $3
+"""
+
+_REMAINING_SQL = f"""
+SELECT count(*)::int AS remaining FROM medical_documents
+WHERE id > $1 AND {_STALE_FILTER}
+"""
+
+# Takes over the run for a version unless another live runner holds it. A
+# finished run is restarted from the beginning to pick up documents that
+# failed or were added with an older pipeline since.
+_CLAIM_SQL = """
+INSERT INTO backfill_runs (pipeline_version, locked_by, heartbeat_at, updated_at)
+VALUES ($1, $2, now(), now())
+ON CONFLICT (pipeline_version) DO UPDATE
+SET status = 'running', locked_by = EXCLUDED.locked_by, heartbeat_at = now(),
+    last_error = NULL, updated_at = now(),
+    last_document_id = CASE WHEN backfill_runs.status = 'done' THEN 0 ELSE backfill_runs.last_document_id END,
+    processed = CASE WHEN backfill_runs.status = 'done' THEN 0 ELSE backfill_runs.processed END,
+    failed = CASE WHEN backfill_runs.status = 'done' THEN 0 ELSE backfill_runs.failed END,
+    started_at = CASE WHEN backfill_runs.status = 'done' THEN now() ELSE backfill_runs.started_at END
+WHERE backfill_runs.locked_by IS NULL
+   OR backfill_runs.locked_by = EXCLUDED.locked_by
+   OR backfill_runs.heartbeat_at < now() - ($3::int * interval '1 second')
+RETURNING id, last_document_id, processed, failed
+"""
+
+_CHECKPOINT_SQL = """
+UPDATE backfill_runs
+SET last_document_id = $3, processed = processed + $4, failed = failed + $5,
+    total = $6, heartbeat_at = now(), updated_at = now()
+WHERE id = $1 AND locked_by = $2
+RETURNING processed, failed
+"""
+
+_HEARTBEAT_SQL = """
+UPDATE backfill_runs SET heartbeat_at = now(), updated_at = now()
+WHERE id = $1 AND locked_by = $2
+"""
+
+_RELEASE_SQL = """
+UPDATE backfill_runs
+SET status = $3, last_error = $4, locked_by = NULL, updated_at = now()
+WHERE id = $1 AND locked_by = $2
+"""
+
+_LIVE_BACKLOG_SQL = """
+SELECT count(*)::int AS backlog FROM analysis_jobs
+WHERE status = 'queued' AND run_after <= now()
+"""
+
+
+class BackfillBusy(Exception):
+    pass
+
+
+class _RateLimiter:
+    """
+    Spaces acquisitions at least 1/rate seconds apart.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+async def reanalyze_document(db: Prisma, document_id: int) -> bool:
+    """
+    Brings one document's stored analysis up to the current pipeline
+    version, re-running only the stages that changed.
+
+    Returns False if the document is gone or no longer processed.
+    """
+    document = await db.medicaldocument.find_unique(where={'id': document_id})
+    if document is None or document.analysis_status != 'processed':
+        return False
+
+    result = await blob_store.cached_analysis(db, document.content_hash, services.PIPELINE_VERSION)
+    if result is None:
+        async with blob_store.local_file(document.content_hash, document.file_path) as path:
+            result = await services.analyze_document(
+                str(path), document.content_hash,
+                previous=parse_analysis(document.ai_analysis_json),
+            )
+        if document.content_hash:
+            await blob_store.store_analysis(db, document.content_hash, services.PIPELINE_VERSION, result)
+
+    updated = await db.medicaldocument.update_many(
+        where={'id': document_id, 'analysis_status': 'processed'},
+        data={'ai_analysis_json': Json(result)},
+    )
+    if not updated:
+        return False
+    await record_analysis(db, document_id, document.patient_id, result)
+    return True
+
+
+class BackfillRunner:
+    """
+    Re-analyzes every processed document whose analysis predates the current
+    pipeline version, walking them in id order and checkpointing after each
+    batch to backfill_runs so an interrupted run resumes where it stopped.
+
+    Throttled by a start rate and a concurrency limit, and pauses while live
+    analysis jobs are waiting, so uploads keep their latency.
+    """
+
+    def __init__(self, db: Prisma):
+        self.db = db
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}:backfill"
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self._started = None
+        self._session_done = 0
+        self._done = 0
+        self._failed = 0
+        self._total = 0
+        self._last_id = 0
+        self._status = 'idle'
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, **options) -> None:
+        """
+        Takes the backfill lease, then runs the backfill in the background of
+        this process. Raises BackfillBusy if a run holds it here or elsewhere.
+        """
+        if self.running:
+            raise BackfillBusy("A backfill is already running in this process")
+        run = await self._claim()
+        # Another start() may have won while the lease was being taken; the
+        # lease is held per process, so it stays with that run.
+        if self.running:
+            raise BackfillBusy("A backfill is already running in this process")
+        self._task = asyncio.create_task(self._run(run, **options))
+        self._task.add_done_callback(self._log_result)
+
+    def _log_result(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Backfill stopped: %s", task.exception())
+
+    async def stop(self, cancel: bool = False) -> None:
+        """
+        Asks the run to stop after the current batch and waits for it. With
+        cancel, the current batch is abandoned; it is redone on resume.
+        """
+        self._stopping = True
+        if self._task is not None:
+            if cancel:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def run(
+        self,
+        rate: float = BACKFILL_RATE,
+        concurrency: int = BACKFILL_CONCURRENCY,
+        batch_size: int = BACKFILL_BATCH_SIZE,
+        on_progress: Optional[Callable[[dict], None]] = None,
+    ) -> dict:
+        return await self._run(await self._claim(), rate, concurrency, batch_size, on_progress)
+
+    async def _claim(self) -> dict:
+        version = services.PIPELINE_VERSION
+        rows = await self.db.query_raw(_CLAIM_SQL, version, self.runner_id, BACKFILL_LEASE_SECONDS)
+        if not rows:
+            raise BackfillBusy(f"Backfill for pipeline {version} is running elsewhere")
+        return rows[0]
+
+    async def _run(
+        self,
+        run: dict,
+        rate: float = BACKFILL_RATE,
+        concurrency: int = BACKFILL_CONCURRENCY,
+        batch_size: int = BACKFILL_BATCH_SIZE,
+        on_progress: Optional[Callable[[dict], None]] = None,
+    ) -> dict:
+        version = services.PIPELINE_VERSION
+        self._reset()
+        self._stopping = False
+        self._status = 'running'
+        self._started = time.monotonic()
+        self._done, self._failed, self._last_id = run['processed'], run['failed'], run['last_document_id']
+        remaining = (await self.db.query_raw(_REMAINING_SQL, self._last_id, version))[0]['remaining']
+        self._total = self._done + self._failed + remaining
+        logger.info("Backfill to pipeline %s: %d documents remaining after id %d", version, remaining, self._last_id)
+
+        limiter = _RateLimiter(rate)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def process(document_id: int) -> bool:
+            async with semaphore:
+                await limiter.acquire()
+                try:
+                    await reanalyze_document(self.db, document_id)
+                    return True
+                except Exception:
+                    logger.exception("Backfill of document %d failed", document_id)
+                    return False
+
+        status, error = 'paused', None
+        # Batches and waits for live jobs can outlast the lease, so it is
+        # renewed independently of the checkpoints.
+        heartbeat = asyncio.create_task(self._heartbeat(run['id']))
+        try:
+            while not self._stopping:
+                await self._wait_for_live_backlog()
+                batch = await self.db.query_raw(_NEXT_BATCH_SQL, self._last_id, version, batch_size)
+                if not batch:
+                    status = 'done'
+                    break
+                outcomes = await asyncio.gather(*(process(row['id']) for row in batch))
+                succeeded = sum(outcomes)
+                checkpoint = await self.db.query_raw(
+                    _CHECKPOINT_SQL, run['id'], self.runner_id, batch[-1]['id'],
+                    succeeded, len(outcomes) - succeeded, self._total,
+                )
+                if not checkpoint:
+                    raise BackfillBusy("Backfill lease was taken over by another runner")
+                self._last_id = batch[-1]['id']
+                self._done, self._failed = checkpoint[0]['processed'], checkpoint[0]['failed']
+                self._session_done += len(outcomes)
+                if on_progress is not None:
+                    on_progress(self.stats())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status, error = 'failed', f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            heartbeat.cancel()
+            self._status = status
+            await self.db.execute_raw(_RELEASE_SQL, run['id'], self.runner_id, status, error)
+        return self.stats()
+
+    async def _heartbeat(self, run_id: int) -> None:
+        while True:
+            await asyncio.sleep(BACKFILL_LEASE_SECONDS / 3)
+            try:
+                await self.db.execute_raw(_HEARTBEAT_SQL, run_id, self.runner_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to renew the backfill lease")
+
+    async def _wait_for_live_backlog(self) -> None:
+        while not self._stopping:
+            rows = await self.db.query_raw(_LIVE_BACKLOG_SQL)
+            if rows[0]['backlog'] <= BACKFILL_MAX_LIVE_BACKLOG:
+                break
+            self._status = 'yielding'
+            await asyncio.sleep(1)
+        self._status = 'running'
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        rate = self._session_done / elapsed if elapsed else 0.0
+        remaining = max(self._total - self._done - self._failed, 0)
+        return {
+            'status': self._status,
+            'pipeline_version': services.PIPELINE_VERSION,
+            'processed': self._done,
+            'failed': self._failed,
+            'total': self._total,
+            'remaining': remaining,
+            'last_document_id': self._last_id,
+            'docs_per_second': round(rate, 3),
+            'eta_seconds': round(remaining / rate) if rate else None,
+        }
+
+
+backfill_runner = BackfillRunner(db)
+metrics.register("backfill", backfill_runner.stats)
@@ -0,0 +1,101 @@
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item calls into batched calls.
+
+    Callers await submit(item) as if calling the model directly. Items are
+    collected until max_batch_size are waiting or the oldest has waited
+    max_wait_ms, then batch_fn runs once on the whole list and each caller
+    receives the result at its position.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        name: str = "batcher",
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._pending: list = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: set = set()
+
+        self.batches = 0
+        self.items = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+        task = asyncio.create_task(self._run(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, batch: list) -> None:
+        now = time.perf_counter()
+        waits = [now - enqueued for _, _, enqueued in batch]
+        self.batches += 1
+        self.items += len(batch)
+        self.total_wait += sum(waits)
+        self.max_observed_wait = max(self.max_observed_wait, *waits)
+
+        try:
+            results = await self.batch_fn([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"{self.name}: batch of {len(batch)} returned {len(results)} results"
+                )
+        except BaseException as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'fill_ratio': self.items / (self.batches * self.max_batch_size) if self.batches else 0.0,
+            'avg_queue_wait_ms': self.total_wait / self.items * 1000 if self.items else 0.0,
+            'max_queue_wait_ms': self.max_observed_wait * 1000,
+            'pending': len(self._pending),
+        }
@@ -0,0 +1,276 @@
+"""
+Benchmarks the API routers in-process, against the database in DATABASE_URL.
+
+    python -m backend.benchmarks.api_suite \
+        --doctors 20 --patients-per-doctor 50 --documents-per-patient 20 \
+        --concurrency 32 --duration 60 \
+        --mix login=1,upload=1,documents=4,roster=4 \
+        --output results.json [--baseline previous.json]
+
+The app runs in this process behind httpx's ASGI transport, with its startup
+hooks (database, analysis workers) running as they would under uvicorn. A
+synthetic population of doctors, patients, links and processed documents is
+seeded under a unique email prefix and removed afterwards (unless --keep).
+
+--concurrency clients then issue requests picked from --mix by weight for
+--duration seconds. Per endpoint, throughput, status counts and latency
+percentiles are written as JSON; with --baseline, the relative change of
+each percentile against an earlier result is included. Runs with the same
+--seed issue the same request sequence per client.
+
+The mock analysis services sleep for --ocr-seconds, --nlp-seconds and
+--cv-seconds; set them to 0 to measure the pipeline and queue without
+simulated model time.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import httpx
+
+from backend.benchmarks.common import percentiles
+
+PASSWORD = "benchmark-password"
+
+ENDPOINTS = {
+    "login": "POST /api/auth/token",
+    "upload": "POST /api/patient/upload/",
+    "documents": "GET /api/patient/documents",
+    "roster": "GET /api/doctor/patients",
+}
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown workload '{name}', expected one of {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Population:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.doctors: list = []
+        self.patients: list = []
+        self.tokens: dict = {}
+
+
+async def seed(db, args, prefix: str) -> Population:
+    from backend import auth
+    from backend.prisma_client import Json
+
+    population = Population(prefix)
+    hashed = auth.get_password_hash(PASSWORD)
+    doctors = [
+        {'email': f"{prefix}-doctor-{n}@bench.local", 'name': f"Doctor {n}",
+         'hashed_password': hashed, 'role': 'doctor'}
+        for n in range(args.doctors)
+    ]
+    patients = [
+        {'email': f"{prefix}-patient-{n}@bench.local", 'name': f"Patient {n}",
+         'hashed_password': hashed, 'role': 'patient'}
+        for n in range(args.doctors * args.patients_per_doctor)
+    ]
+    await db.user.create_many(data=doctors + patients)
+    users = await db.user.find_many(where={'email': {'startswith': f"{prefix}-"}}, order={'id': 'asc'})
+    population.doctors = [user for user in users if user.role == 'doctor']
+    population.patients = [user for user in users if user.role == 'patient']
+
+    links = [
+        {'doctor_id': doctor.id, 'patient_id': patient.id}
+        for n, doctor in enumerate(population.doctors)
+        for patient in population.patients[n * args.patients_per_doctor:(n + 1) * args.patients_per_doctor]
+    ]
+    if links:
+        await db.doctorpatient.create_many(data=links)
+
+    # Stored the way jobs._complete writes analyses, as native JSON.
+    analysis = Json({
+        "ocr_result": "Patient prescribed Amoxicillin 500mg for a bacterial infection.",
+        "nlp_result": {"summary": "Benchmark document.", "entities": []},
+        "cv_result": {"classification": "Normal", "confidence": 0.5},
+    })
+    documents = [
+        {'patient_id': patient.id, 'file_path': f"bench/{prefix}/{patient.id}-{n}.txt",
+         'filename': f"report-{n}.txt", 'analysis_status': 'processed', 'ai_analysis_json': analysis}
+        for patient in population.patients
+        for n in range(args.documents_per_patient)
+    ]
+    for start in range(0, len(documents), 5000):
+        await db.medicaldocument.create_many(data=documents[start:start + 5000])
+
+    # Outlive the run, however long seeding and the workload take.
+    lifetime = timedelta(seconds=args.duration + 3600)
+    for user in users:
+        population.tokens[user.id] = auth.create_access_token(data={"sub": user.email}, expires_delta=lifetime)
+    return population
+
+
+async def cleanup(db, population: Population) -> None:
+    from backend import blob_store
+
+    patient_ids = [patient.id for patient in population.patients]
+    uploaded = await db.medicaldocument.find_many(
+        where={'patient_id': {'in': patient_ids}, 'content_hash': {'not': None}}
+    )
+    await db.medicaldocument.delete_many(where={'patient_id': {'in': patient_ids}})
+    for document in uploaded:
+        await blob_store.release(db, document.content_hash)
+    await db.doctorpatient.delete_many(where={'patient_id': {'in': patient_ids}})
+    await db.user.delete_many(where={'email': {'startswith': f"{population.prefix}-"}})
+
+
+async def client_loop(client: httpx.AsyncClient, population: Population, args, rng: random.Random,
+                      deadline: float, results: dict) -> None:
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    upload_size = args.upload_kb * 1024
+
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        if name in ("login", "roster"):
+            user = rng.choice(population.doctors)
+        else:
+            user = rng.choice(population.patients)
+        headers = {"Authorization": f"Bearer {population.tokens[user.id]}"}
+
+        started = time.perf_counter()
+        if name == "login":
+            response = await client.post("/api/auth/token", data={"username": user.email, "password": PASSWORD})
+        elif name == "upload":
+            content = rng.randbytes(upload_size)
+            response = await client.post(
+                "/api/patient/upload/", headers=headers,
+                files={"file": ("bench.txt", content, "text/plain")},
+            )
+        elif name == "documents":
+            response = await client.get("/api/patient/documents", headers=headers)
+        else:
+            response = await client.get("/api/doctor/patients", headers=headers)
+        elapsed = time.perf_counter() - started
+
+        entry = results[name]
+        entry["statuses"][response.status_code] += 1
+        if response.status_code < 400:
+            entry["latencies"].append(elapsed)
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    """
+    Relative change of each percentile (positive means slower).
+    """
+    changes = {}
+    for name, stats in current.items():
+        before = baseline.get("endpoints", {}).get(name, {}).get("latency", {})
+        after = stats.get("latency", {})
+        changes[name] = {
+            key: round((after[key] - before[key]) / before[key], 4)
+            for key in ("p50_ms", "p95_ms", "p99_ms")
+            if before.get(key) and key in after
+        }
+    return changes
+
+
+async def run(args) -> dict:
+    from backend.main import app
+    from backend.prisma_db import db
+    from backend import services
+
+    services.MOCK_OCR_SECONDS = args.ocr_seconds
+    services.MOCK_NLP_SECONDS = args.nlp_seconds
+    services.MOCK_CV_SECONDS = args.cv_seconds
+
+    results = defaultdict(lambda: {"latencies": [], "statuses": Counter()})
+    async with app.router.lifespan_context(app):
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        seed_started = time.perf_counter()
+        population = await seed(db, args, prefix)
+        seed_seconds = time.perf_counter() - seed_started
+        try:
+            transport = httpx.ASGITransport(app=app)
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench", timeout=None, limits=limits
+            ) as client:
+                started = time.perf_counter()
+                deadline = started + args.duration
+                await asyncio.gather(*(
+                    client_loop(client, population, args, random.Random(args.seed + n), deadline, results)
+                    for n in range(args.concurrency)
+                ))
+                elapsed = time.perf_counter() - started
+        finally:
+            if not args.keep:
+                await cleanup(db, population)
+
+    endpoints = {}
+    for name in args.mix:
+        entry = results[name]
+        total = sum(entry["statuses"].values())
+        endpoints[name] = {
+            "endpoint": ENDPOINTS[name],
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2),
+            "statuses": {str(code): count for code, count in sorted(entry["statuses"].items())},
+            "latency": percentiles(entry["latencies"]),
+        }
+
+    report = {
+        "config": {
+            "doctors": args.doctors,
+            "patients_per_doctor": args.patients_per_doctor,
+            "documents_per_patient": args.documents_per_patient,
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "mix": args.mix,
+            "upload_kb": args.upload_kb,
+            "mock_seconds": {"ocr": args.ocr_seconds, "nlp": args.nlp_seconds, "cv": args.cv_seconds},
+            "seed": args.seed,
+        },
+        "seed_seconds": round(seed_seconds, 2),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(sum(e["requests"] for e in endpoints.values()) / elapsed, 2),
+        "endpoints": endpoints,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["vs_baseline"] = compare(endpoints, json.load(f))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=10)
+    parser.add_argument("--patients-per-doctor", type=int, default=20)
+    parser.add_argument("--documents-per-patient", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("login=1,upload=1,documents=4,roster=4"))
+    parser.add_argument("--upload-kb", type=int, default=64)
+    parser.add_argument("--ocr-seconds", type=float, default=1.0)
+    parser.add_argument("--nlp-seconds", type=float, default=1.5)
+    parser.add_argument("--cv-seconds", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="leave the seeded data in place")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
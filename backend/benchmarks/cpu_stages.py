@@ -0,0 +1,111 @@
+"""
+Compares ways of running the CPU-bound stand-in models from an event loop.
+
+    python -m backend.benchmarks.cpu_stages --documents 32 --size-kb 256
+
+Modes:
+  in-loop  calls the model directly inside the coroutine (what a naive
+           async service does); blocks the loop for every call
+  thread   offloads to the default thread pool; the loop stays responsive
+           but the GIL serializes the work
+  process  uses backend.executors.CpuExecutor with warm per-process models
+
+For each mode it reports documents/second and the worst event-loop stall
+seen by a 10 ms ticker running alongside. Needs no GPU or DB, so it can run
+in CI.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from backend import inference
+from backend.executors import CpuExecutor
+
+
+async def ticker(stop: asyncio.Event, interval: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def analyze_in_loop(path: str):
+    inference.predict("ocr", path)
+    inference.predict("cv", path)
+
+
+async def analyze_in_thread(path: str):
+    await asyncio.gather(
+        asyncio.to_thread(inference.predict, "ocr", path),
+        asyncio.to_thread(inference.predict, "cv", path),
+    )
+
+
+def make_process_mode(executor: CpuExecutor):
+    async def analyze_in_process(path: str):
+        await asyncio.gather(executor.run("ocr", path), executor.run("cv", path))
+    return analyze_in_process
+
+
+async def measure(analyze, paths) -> dict:
+    stop = asyncio.Event()
+    stall = asyncio.create_task(ticker(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(analyze(path) for path in paths))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return {
+        "seconds": round(elapsed, 3),
+        "documents_per_second": round(len(paths) / elapsed, 2),
+        "max_loop_stall_ms": round(await stall * 1000, 1),
+    }
+
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = []
+        for n in range(args.documents):
+            path = os.path.join(workdir, f"doc-{n}.bin")
+            with open(path, "wb") as f:
+                f.write(os.urandom(args.size_kb * 1024))
+            paths.append(path)
+
+        results = {}
+        if "in-loop" in args.modes:
+            inference.warm_up(inference.MODELS)
+            results["in-loop"] = await measure(analyze_in_loop, paths)
+        if "thread" in args.modes:
+            inference.warm_up(inference.MODELS)
+            results["thread"] = await measure(analyze_in_thread, paths)
+        if "process" in args.modes:
+            executor = CpuExecutor(workers=args.workers)
+            # Warm the pool so process start-up isn't billed to the run.
+            await asyncio.gather(*(executor.run("ocr", paths[0]) for _ in range(args.workers)))
+            results["process"] = await measure(make_process_mode(executor), paths)
+            executor.shutdown()
+
+    return {
+        "documents": args.documents,
+        "size_kb": args.size_kb,
+        "workers": args.workers,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=32)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--modes", nargs="+", default=["in-loop", "thread", "process"])
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Measures how a login rush affects unrelated endpoints.
+
+Runs against a live server with an existing account:
+
+    python -m backend.benchmarks.login_storm \
+        --base-url http://localhost:8000 \
+        --email doctor@example.com --password secret \
+        --logins 200 --concurrency 50
+
+While --concurrency clients repeatedly POST /api/auth/token, a probe
+client polls GET / (which touches neither bcrypt nor the database). The
+probe's p50/p95/p99 are reported for an idle phase and for the storm.
+Run it once against a build that hashes inline and once against the
+current one to compare before and after. 503 responses mean the password
+hashing queue was saturated and are counted separately.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from backend.benchmarks.common import percentiles
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, interval: float) -> list:
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/")
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def login_worker(client: httpx.AsyncClient, args, remaining: list, results: dict) -> None:
+    while remaining:
+        remaining.pop()
+        started = time.perf_counter()
+        response = await client.post(
+            "/api/auth/token", data={"username": args.email, "password": args.password}
+        )
+        elapsed = time.perf_counter() - started
+        if response.status_code == 200:
+            results["ok"].append(elapsed)
+        elif response.status_code in (429, 503):
+            results["rejected"] += 1
+        else:
+            results["errors"] += 1
+
+
+async def run(args) -> dict:
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=httpx.Timeout(None)) as client:
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe(client, stop, args.interval))
+        await asyncio.sleep(args.idle_seconds)
+        stop.set()
+        idle = await prober
+
+        results = {"ok": [], "rejected": 0, "errors": 0}
+        remaining = list(range(args.logins))
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe(client, stop, args.interval))
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(login_worker(client, args, remaining, results) for _ in range(args.concurrency))
+        )
+        elapsed = time.perf_counter() - started
+        stop.set()
+        storm = await prober
+
+    return {
+        "logins": args.logins,
+        "concurrency": args.concurrency,
+        "storm_seconds": round(elapsed, 2),
+        "logins_per_second": round(len(results["ok"]) / elapsed, 2),
+        "login_latency": percentiles(results["ok"]),
+        "rejected": results["rejected"],
+        "errors": results["errors"],
+        "probe_idle": percentiles(idle),
+        "probe_during_storm": percentiles(storm),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.02)
+    parser.add_argument("--idle-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Compares the cost of serializing a patient's document listing three ways:
+
+    python -m backend.benchmarks.serialization --documents 20000 [--entities 30]
+
+  pydantic  the previous path: every row validated into DocumentInfo, then
+            jsonable_encoder + json.dumps, as FastAPI does for a returned
+            list of models
+  fast      analysis JSON text passed through from the database and spliced
+            into rows encoded by backend.serialization (orjson if installed)
+  ndjson    the same encoding, one page of rows at a time, as the /stream
+            endpoints send it
+
+Each variant runs in a fresh interpreter so its peak RSS can be measured on
+its own. Synthetic rows are generated page by page, as the database would
+return them; generation is excluded from the timings but included in RSS,
+which is reported above the interpreter's RSS after imports. Prints JSON.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+PAGE_SIZE = 200
+
+
+def make_analysis(n: int, entities: int) -> dict:
+    return {
+        "ocr_result": f"Document {n}. " + "Patient prescribed Amoxicillin 500mg for a bacterial infection. " * 20,
+        "nlp_result": {
+            "summary": "The patient was prescribed Amoxicillin for a bacterial infection.",
+            "entities": [{"text": f"Entity {i}", "label": "MEDICATION"} for i in range(entities)],
+        },
+        "cv_result": {"classification": "Pneumonia Detected", "confidence": 0.92, "heatmap_url": None},
+        "stage_timings": {stage: {"seconds": 1.0, "attempts": 1, "cached": False} for stage in ("ocr", "nlp", "cv")},
+    }
+
+
+def pages(documents: int, entities: int, as_text: bool):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for first in range(0, documents, PAGE_SIZE):
+        page = []
+        for n in range(first, min(first + PAGE_SIZE, documents)):
+            analysis = make_analysis(n, entities)
+            page.append({
+                'id': n + 1,
+                'filename': f"report-{n}.pdf",
+                'file_path': f"uploads/report-{n}.pdf",
+                'content_hash': None,
+                'upload_timestamp': start + timedelta(minutes=n),
+                'analysis_status': 'processed',
+                'ai_analysis': json.dumps(analysis) if as_text else analysis,
+            })
+        yield page
+
+
+def run_pydantic(args) -> tuple:
+    from fastapi.encoders import jsonable_encoder
+    from backend.schemas import DocumentInfo
+
+    rows = [row for page in pages(args.documents, args.entities, as_text=False) for row in page]
+    started = time.perf_counter()
+    models = [
+        DocumentInfo(
+            id=row['id'],
+            filename=row['filename'],
+            upload_timestamp=row['upload_timestamp'],
+            ai_analysis=row['ai_analysis'],
+            analysis_status=row['analysis_status'],
+        )
+        for row in rows
+    ]
+    body = json.dumps(jsonable_encoder(models)).encode()
+    return time.perf_counter() - started, len(body)
+
+
+def run_fast(args) -> tuple:
+    from backend.documents import encode_document
+    from backend.serialization import encode_array
+
+    elapsed, encoded = 0.0, []
+    for page in pages(args.documents, args.entities, as_text=True):
+        started = time.perf_counter()
+        encoded.extend(encode_document(row) for row in page)
+        elapsed += time.perf_counter() - started
+    started = time.perf_counter()
+    body = encode_array(encoded)
+    return elapsed + time.perf_counter() - started, len(body)
+
+
+def run_ndjson(args) -> tuple:
+    from backend.documents import encode_document
+
+    elapsed, size = 0.0, 0
+    for page in pages(args.documents, args.entities, as_text=True):
+        started = time.perf_counter()
+        for row in page:
+            size += len(encode_document(row) + b"\n")
+        elapsed += time.perf_counter() - started
+    return elapsed, size
+
+
+VARIANTS = {"pydantic": run_pydantic, "fast": run_fast, "ndjson": run_ndjson}
+
+
+def run_variant(args) -> dict:
+    # Import everything up front so the RSS baseline includes the modules.
+    import fastapi.encoders  # noqa: F401
+    import backend.documents  # noqa: F401
+    import backend.schemas  # noqa: F401
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seconds, size = VARIANTS[args.variant](args)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "seconds": round(seconds, 4),
+        "bytes": size,
+        "peak_rss_mb": round((peak_kb - baseline_kb) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--entities", type=int, default=30, help="entities per analysis")
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args)))
+        return
+
+    results = {}
+    for variant in VARIANTS:
+        output = subprocess.run(
+            [sys.executable, "-m", "backend.benchmarks.serialization",
+             "--documents", str(args.documents), "--entities", str(args.entities), "--variant", variant],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[variant] = json.loads(output)
+
+    try:
+        import orjson  # noqa: F401
+        encoder = "orjson"
+    except ImportError:
+        encoder = "json"
+    print(json.dumps({
+        "documents": args.documents,
+        "entities_per_document": args.entities,
+        "encoder": encoder,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures /api/doctor/patients latency while large uploads are in flight.
+
+Runs against a live server:
+
+    python -m backend.benchmarks.upload_latency \
+        --base-url http://localhost:8000 \
+        --patient-token <jwt> --doctor-token <jwt> \
+        --uploads 4 --size-mb 100
+
+It first samples the roster endpoint on an idle server, then again while
+--uploads concurrent uploads of --size-mb each are streaming, and prints
+p50/p95/p99 for both phases as JSON.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from backend.benchmarks.common import percentiles
+
+
+class ZeroStream:
+    """A file-like object producing size bytes without holding them in memory."""
+
+    def __init__(self, size: int):
+        self.remaining = size
+
+    def read(self, n: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        if n < 0 or n > self.remaining:
+            n = self.remaining
+        n = min(n, 1024 * 1024)
+        self.remaining -= n
+        return b"\0" * n
+
+
+async def sample_roster(client: httpx.AsyncClient, token: str, stop: asyncio.Event, interval: float) -> list:
+    samples = []
+    headers = {"Authorization": f"Bearer {token}"}
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/api/doctor/patients", headers=headers)
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def upload(client: httpx.AsyncClient, token: str, size: int, n: int) -> float:
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/patient/upload/",
+        headers={"Authorization": f"Bearer {token}"},
+        files={"file": (f"bench-{n}.bin", ZeroStream(size), "application/octet-stream")},
+    )
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def run(args) -> dict:
+    timeout = httpx.Timeout(None)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client:
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_roster(client, args.doctor_token, stop, args.interval))
+        await asyncio.sleep(args.idle_seconds)
+        stop.set()
+        idle = await sampler
+
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_roster(client, args.doctor_token, stop, args.interval))
+        size = args.size_mb * 1024 * 1024
+        upload_times = await asyncio.gather(
+            *(upload(client, args.patient_token, size, n) for n in range(args.uploads))
+        )
+        stop.set()
+        loaded = await sampler
+
+    return {
+        "uploads": args.uploads,
+        "upload_size_mb": args.size_mb,
+        "upload_seconds": [round(t, 2) for t in upload_times],
+        "roster_idle": percentiles(idle),
+        "roster_during_uploads": percentiles(loaded),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--patient-token", required=True)
+    parser.add_argument("--doctor-token", required=True)
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--idle-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import time
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from backend.prisma_client import Json, Prisma
+from backend.documents import parse_analysis
+from backend.ingest import IngestedFile, stream_to_disk
+from backend.storage import UPLOAD_DIR, storage
+
+INCOMING_DIR = UPLOAD_DIR / "incoming"
+INCOMING_DIR.mkdir(parents=True, exist_ok=True)
+
+# How long commit() waits for a release() deleting the same content before
+# assuming it died part way and taking the blob over.
+RELEASE_WAIT_SECONDS = 30
+
+# Takes a reference on the blob. A blob whose last reference is gone keeps
+# its row, at ref_count 0, while release() deletes the object; the upsert
+# then changes nothing and commit() waits for the row to go, unless $4 says
+# to take it over.
+_ACQUIRE_SQL = """
+INSERT INTO blobs (sha256, size, path, ref_count)
+VALUES ($1, $2, $3, 1)
+ON CONFLICT (sha256) DO UPDATE SET ref_count = blobs.ref_count + 1
+WHERE blobs.ref_count > 0 OR $4::boolean
+"""
+
+_RELEASE_SQL = """
+UPDATE blobs SET ref_count = ref_count - 1
+WHERE sha256 = $1
+RETURNING ref_count
+"""
+
+_DELETE_SQL = """
+DELETE FROM blobs WHERE sha256 = $1 AND ref_count <= 0
+"""
+
+
+def blob_key(sha256: str) -> str:
+    """
+    Storage key of a blob, fanned out by hash prefix: ab/cd/abcd....
+    """
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+@asynccontextmanager
+async def local_file(content_hash: Optional[str], file_path: Optional[str]):
+    """
+    A path on disk holding a document's bytes, for code that needs a real
+    file (analysis, renditions). Legacy documents are read where they are.
+    """
+    if content_hash:
+        async with storage.open_local(blob_key(content_hash)) as path:
+            yield path
+    else:
+        yield Path(file_path)
+
+
+async def ingest(upload: UploadFile) -> IngestedFile:
+    """
+    Streams an upload into the incoming area; commit() moves it into the store.
+    """
+    return await stream_to_disk(upload, INCOMING_DIR / uuid.uuid4().hex)
+
+
+async def commit(db: Prisma, ingested: IngestedFile, move: bool = True) -> str:
+    """
+    Adds a reference to the blob for ingested's content, storing the bytes
+    only if no identical blob exists yet. Returns the blob's storage key.
+
+    The reference is taken first, in its own short statement, so a slow
+    upload to remote storage never holds a transaction open.
+    """
+    key = blob_key(ingested.sha256)
+    deadline = time.monotonic() + RELEASE_WAIT_SECONDS
+    while not await db.execute_raw(
+        _ACQUIRE_SQL, ingested.sha256, ingested.size, key, time.monotonic() >= deadline
+    ):
+        # The object is being deleted; it is stored afresh once it's gone.
+        await asyncio.sleep(0.05)
+    try:
+        await storage.put(key, ingested.path, move=move)
+    except BaseException:
+        await release(db, ingested.sha256)
+        raise
+    return key
+
+
+async def discard(ingested: IngestedFile) -> None:
+    await run_in_threadpool(ingested.path.unlink, True)
+
+
+async def release(db: Prisma, sha256: str) -> bool:
+    """
+    Drops one reference to a blob, deleting the object with the last one.
+
+    Returns True if the blob was removed.
+    """
+    rows = await db.query_raw(_RELEASE_SQL, sha256)
+    if not rows or rows[0]['ref_count'] > 0:
+        return False
+    # The row stays until the object is deleted, so no lock is held over the
+    # network call and a commit() of the same content meanwhile waits.
+    try:
+        await storage.delete(blob_key(sha256))
+    finally:
+        # Even if the delete failed: a leftover object is reused by the next
+        # commit(), while a leftover row would block it.
+        await db.execute_raw(_DELETE_SQL, sha256)
+    return True
+
+
+async def cached_analysis(db: Prisma, sha256: Optional[str], pipeline_version: str):
+    if sha256 is None:
+        return None
+    entry = await db.analysiscache.find_unique(
+        where={
+            'content_hash_pipeline_version': {
+                'content_hash': sha256,
+                'pipeline_version': pipeline_version,
+            }
+        }
+    )
+    return parse_analysis(entry.result) if entry else None
+
+
+async def store_analysis(db: Prisma, sha256: str, pipeline_version: str, result: dict) -> None:
+    await db.analysiscache.upsert(
+        where={
+            'content_hash_pipeline_version': {
+                'content_hash': sha256,
+                'pipeline_version': pipeline_version,
+            }
+        },
+        data={
+            'create': {
+                'content_hash': sha256,
+                'pipeline_version': pipeline_version,
+                'result': Json(result),
+            },
+            'update': {'result': Json(result)},
+        },
+    )
@@ -0,0 +1,200 @@
+import json
+import base64
+from datetime import datetime
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from backend.prisma_client import Prisma
+from backend.serialization import FastJSONResponse, encode_array, encode_with_raw
+
+DOCUMENT_PAGE_SIZE = 200
+
+# Newest first, paged on (upload_timestamp, id). The cursor timestamp is
+# read back as text so it round-trips at full microsecond precision. Legacy
+# rows without a timestamp sort last, as '-infinity'.
+_SUMMARY_SQL = """
+SELECT id,
+       COALESCE(filename, regexp_replace(file_path, '^.*/', '')) AS filename,
+       upload_timestamp,
+       analysis_status,
+       COALESCE(upload_timestamp, '-infinity')::text AS cursor_ts
+FROM medical_documents
+WHERE patient_id = $1
+  AND ($2::timestamptz IS NULL
+       OR (COALESCE(upload_timestamp, '-infinity'), id) < ($2::timestamptz, $3::int))
+ORDER BY COALESCE(upload_timestamp, '-infinity') DESC, id DESC
+LIMIT $4
+"""
+
+# Full documents in upload order, paged on id. The analysis comes back as
+# JSON text so it can be passed through without decoding; rows written
+# before analyses were stored as native JSON hold a JSON-encoded string,
+# which is unwrapped here.
+_DOCUMENTS_SQL = """
+SELECT id,
+       COALESCE(filename, regexp_replace(file_path, '^.*/', '')) AS filename,
+       file_path,
+       content_hash,
+       upload_timestamp,
+       analysis_status,
+       CASE WHEN jsonb_typeof(ai_analysis_json) = 'string' THEN ai_analysis_json #>> '{}'
+            ELSE ai_analysis_json::text
+       END AS ai_analysis
+FROM medical_documents
+WHERE patient_id = $1 AND id > $2 AND ($4::int IS NULL OR id <= $4)
+ORDER BY id
+LIMIT $3
+"""
+
+# The ETag is computed in the database; the analysis body is only shipped
+# back when it differs from what the client already holds.
+_ANALYSIS_SQL = """
+SELECT id, analysis_status, etag,
+       CASE WHEN etag = $3 THEN NULL
+            WHEN jsonb_typeof(ai_analysis_json) = 'string' THEN (ai_analysis_json #>> '{}')::jsonb
+            ELSE ai_analysis_json
+       END AS ai_analysis
+FROM (
+    SELECT id, analysis_status, ai_analysis_json,
+           md5(analysis_status || ':' || COALESCE(ai_analysis_json::text, '')) AS etag
+    FROM medical_documents
+    WHERE id = $1 AND patient_id = $2
+) doc
+"""
+
+
+def parse_analysis(value: Any) -> Optional[dict]:
+    """
+    ai_analysis_json as a dict, whether it was stored as an object or as a
+    JSON-encoded string.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    return value if isinstance(value, dict) else None
+
+
+def encode_cursor(timestamp: str, document_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp}|{document_id}".encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[Optional[str], int]:
+    if not cursor:
+        return None, 0
+    try:
+        timestamp, document_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        if timestamp != "-infinity":
+            datetime.fromisoformat(timestamp)
+        return timestamp, int(document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def list_document_summaries(
+    db: Prisma, response: Response, patient_id: int, cursor: Optional[str], limit: int
+) -> list:
+    """
+    Returns one page of id/filename/timestamp/status rows for a patient and
+    sets X-Next-Cursor when more remain.
+    """
+    timestamp, document_id = decode_cursor(cursor)
+    rows = await db.query_raw(_SUMMARY_SQL, patient_id, timestamp, document_id, limit)
+    if len(rows) == limit:
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last['cursor_ts'], last['id'])
+    return rows
+
+
+async def iter_documents(db: Prisma, patient_id: int, page_size: int = DOCUMENT_PAGE_SIZE,
+                         after: int = 0, until: Optional[int] = None):
+    """
+    Yields every document row of a patient (with after < id <= until, if
+    given), one page in memory at a time.
+    """
+    while True:
+        rows = await db.query_raw(_DOCUMENTS_SQL, patient_id, after, page_size, until)
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        after = rows[-1]['id']
+
+
+def encode_document(row: dict, extra: Optional[Callable[[dict], dict]] = None) -> bytes:
+    fields = {
+        'id': row['id'],
+        'filename': row['filename'] or "N/A",
+        'upload_timestamp': row['upload_timestamp'],
+        'analysis_status': row['analysis_status'],
+    }
+    if extra is not None:
+        fields.update(extra(row))
+    return encode_with_raw(fields, 'ai_analysis', row['ai_analysis'])
+
+
+async def documents_response(
+    db: Prisma, patient_id: int, extra: Optional[Callable[[dict], dict]] = None
+) -> FastJSONResponse:
+    """
+    All of a patient's documents as a JSON array. Rows are encoded straight
+    from the query results; extra(row) adds per-row fields such as URLs.
+    """
+    encoded = [encode_document(row, extra) async for row in iter_documents(db, patient_id)]
+    return FastJSONResponse(encode_array(encoded))
+
+
+def ndjson_responses(item: str) -> dict:
+    """OpenAPI description of a documents_stream() endpoint."""
+    return {200: {"description": f"One {item} object per line.", "content": {"application/x-ndjson": {}}}}
+
+
+def documents_stream(
+    db: Prisma, patient_id: int, extra: Optional[Callable[[dict], dict]] = None
+) -> StreamingResponse:
+    """
+    Like documents_response, but as newline-delimited JSON sent page by page,
+    so the first documents arrive before the rest are read and memory use
+    doesn't grow with the patient's history.
+    """
+    async def lines():
+        async for row in iter_documents(db, patient_id):
+            yield encode_document(row, extra) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _parse_etags(header: Optional[str]) -> list:
+    if not header:
+        return []
+    return [tag.strip().removeprefix("W/").strip('"') for tag in header.split(",")]
+
+
+async def analysis_response(db: Prisma, request: Request, document_id: int, patient_id: int):
+    """
+    Full analysis for one document, honouring If-None-Match with a 304.
+    """
+    known = _parse_etags(request.headers.get("if-none-match"))
+    rows = await db.query_raw(_ANALYSIS_SQL, document_id, patient_id, known[0] if known else None)
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+
+    row = rows[0]
+    headers = {"ETag": f'"{row["etag"]}"', "Cache-Control": "private, no-cache"}
+    if row['etag'] in known or "*" in known:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return JSONResponse(
+        content={
+            'id': row['id'],
+            'analysis_status': row['analysis_status'],
+            'ai_analysis': row['ai_analysis'],
+        },
+        headers=headers,
+    )
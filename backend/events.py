@@ -0,0 +1,125 @@
+import os
+import json
+import asyncio
+import itertools
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from backend import metrics
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_MAX_CONNECTIONS = int(os.getenv("SSE_MAX_CONNECTIONS", "1000"))
+SSE_MAX_CONNECTIONS_PER_USER = int(os.getenv("SSE_MAX_CONNECTIONS_PER_USER", "5"))
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+
+
+class EventHub:
+    """
+    In-process pub/sub that fans events out to each user's open streams.
+
+    Only streams connected to this process receive events published here,
+    which matches where the analysis workers run (see backend/jobs.py).
+    """
+
+    def __init__(
+        self,
+        max_connections: int = SSE_MAX_CONNECTIONS,
+        max_per_user: int = SSE_MAX_CONNECTIONS_PER_USER,
+        queue_size: int = SSE_QUEUE_SIZE,
+    ):
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._connections = 0
+        self._ids = itertools.count(1)
+        self.published = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def has_subscribers(self) -> bool:
+        return self._connections > 0
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        if self._connections >= self.max_connections or len(self._subscribers.get(user_id, ())) >= self.max_per_user:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many open event streams",
+                headers={"Retry-After": "30"},
+            )
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[user_id].add(queue)
+        self._connections += 1
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues and queue in queues:
+            queues.discard(queue)
+            self._connections -= 1
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, user_ids: Iterable[int], event_type: str, data: dict) -> None:
+        message = (next(self._ids), event_type, data)
+        for user_id in set(user_ids):
+            for queue in self._subscribers.get(user_id, ()):
+                if queue.full():
+                    # Slow consumer: drop its oldest event rather than block.
+                    queue.get_nowait()
+                    self.dropped += 1
+                queue.put_nowait(message)
+        self.published += 1
+
+    def stats(self) -> dict:
+        return {
+            'connections': self._connections,
+            'users': len(self._subscribers),
+            'published': self.published,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+        }
+
+
+def _format(event_id: int, event_type: str, data: dict) -> str:
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def event_stream(user_id: int, heartbeat: Optional[float] = None) -> StreamingResponse:
+    """
+    Opens a Server-Sent Events stream of hub events addressed to user_id,
+    with a comment line every heartbeat seconds to keep proxies from timing
+    the connection out.
+    """
+    heartbeat = SSE_HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+    queue = hub.subscribe(user_id)
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield _format(*message)
+        finally:
+            hub.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also unsubscribe if the client leaves before the stream starts.
+        background=BackgroundTask(hub.unsubscribe, user_id, queue),
+    )
+
+
+hub = EventHub()
+metrics.register("event_hub", hub.stats)
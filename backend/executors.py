@@ -0,0 +1,57 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Sequence
+
+from backend import inference
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+
+
+class CpuExecutor:
+    """
+    Runs CPU-heavy model calls in a pool of worker processes, off the event
+    loop and outside this process's GIL.
+
+    Workers load their models once at start-up and keep them. Inputs are
+    passed as file paths, so only the path and the (small) result cross the
+    process boundary.
+    """
+
+    def __init__(self, workers: int = CPU_WORKERS, models: Sequence[str] = tuple(inference.MODELS)):
+        self.workers = workers
+        self.models = tuple(models)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn rather than fork: the parent runs an event loop and DB
+            # client threads that must not be duplicated into the workers.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=inference.warm_up,
+                initargs=(self.models,),
+            )
+        return self._pool
+
+    async def run(self, model: str, file_path: str):
+        loop = asyncio.get_running_loop()
+        pool = self._ensure_pool()
+        try:
+            return await loop.run_in_executor(pool, inference.predict, model, file_path)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool next time.
+            if self._pool is pool:
+                self._pool = None
+            raise
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+cpu_executor = CpuExecutor()
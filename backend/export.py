@@ -0,0 +1,224 @@
+import io
+import os
+import csv
+import asyncio
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from fastapi.responses import StreamingResponse
+
+from backend.prisma_client import Prisma
+from backend.blob_store import blob_key
+from backend.documents import encode_document, iter_documents, parse_analysis
+from backend.storage import LocalStorage, storage
+
+# An export is cut into parts of at most this many documents / file bytes;
+# X-Next-Cursor points at the next part, so a large history can be fetched
+# (and an interrupted download retried) one part at a time.
+EXPORT_PART_DOCUMENTS = int(os.getenv("EXPORT_PART_DOCUMENTS", "500"))
+EXPORT_PART_BYTES = int(os.getenv("EXPORT_PART_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Chunks read ahead of the network write; bounds memory per export.
+EXPORT_PREFETCH_CHUNKS = int(os.getenv("EXPORT_PREFETCH_CHUNKS", "16"))
+
+_MANIFEST_SQL = """
+SELECT d.id,
+       COALESCE(d.filename, regexp_replace(d.file_path, '^.*/', '')) AS filename,
+       d.file_path,
+       d.content_hash,
+       d.upload_timestamp,
+       b.size
+FROM medical_documents d
+LEFT JOIN blobs b ON b.sha256 = d.content_hash
+WHERE d.patient_id = $1 AND d.id > $2
+ORDER BY d.id
+LIMIT $3
+"""
+
+CSV_COLUMNS = (
+    "id", "filename", "upload_timestamp", "analysis_status", "file",
+    "summary", "classification", "confidence", "entities", "pipeline_version",
+)
+
+# Legacy documents hold their own path (relative or absolute) rather than a
+# storage key; reading them through a driver rooted at "." covers both.
+_legacy_files = LocalStorage(Path())
+
+
+class _Sink:
+    """
+    Write-only file object for ZipFile that hands out what has been written
+    so far. Having no tell(), it makes ZipFile stream entries with data
+    descriptors instead of seeking back to patch headers.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _timestamp(value) -> Optional[datetime]:
+    """Raw queries return timestamps as ISO strings."""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def _zip_info(name: str, timestamp: Optional[datetime], compress_type: int) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name)
+    if timestamp is not None and timestamp.year >= 1980:
+        info.date_time = timestamp.timetuple()[:6]
+    info.compress_type = compress_type
+    return info
+
+
+def _archive_name(row: dict) -> str:
+    filename = (row['filename'] or "document").replace("/", "_").replace("\\", "_")
+    return f"files/{row['id']}-{filename}"
+
+
+async def _open(row: dict):
+    """
+    The size of a document's file and an iterator over its bytes.
+    Raises FileNotFoundError if the file is gone.
+    """
+    if row['content_hash']:
+        source, key = storage, blob_key(row['content_hash'])
+    else:
+        source, key = _legacy_files, row['file_path']
+    info = await source.stat(key)
+    if info is None:
+        raise FileNotFoundError(key)
+    return info.size, (source.read_range(key, 0, info.size - 1) if info.size else None)
+
+
+async def _prefetch(rows: list, queue: asyncio.Queue) -> None:
+    """
+    Reads the part's files in order into a bounded queue, so the next
+    chunk is being read while the previous one is on the wire.
+    """
+    try:
+        for row in rows:
+            try:
+                size, chunks = await _open(row)
+            except FileNotFoundError:
+                # Left out of files/; the analyses still list the document.
+                continue
+            await queue.put(("start", row, size))
+            if chunks is not None:
+                async for chunk in chunks:
+                    await queue.put(("data", chunk))
+            await queue.put(("end",))
+    except Exception as e:
+        await queue.put(("error", e))
+        return
+    await queue.put(None)
+
+
+def _csv_row(row: dict, archive_name: str) -> list:
+    analysis = parse_analysis(row['ai_analysis'] or "") or {}
+    nlp = analysis.get("nlp_result") or {}
+    cv = analysis.get("cv_result") or {}
+    entities = "; ".join(
+        f"{entity.get('text')} ({entity.get('label')})"
+        for entity in nlp.get("entities") or [] if isinstance(entity, dict)
+    )
+    timestamp = _timestamp(row['upload_timestamp'])
+    return [
+        row['id'], row['filename'], timestamp.isoformat() if timestamp else "", row['analysis_status'], archive_name,
+        nlp.get("summary", ""), cv.get("classification", ""), cv.get("confidence", ""), entities,
+        analysis.get("pipeline_version", ""),
+    ]
+
+
+async def _archive(db: Prisma, patient_id: int, rows: list):
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, "w", allowZip64=True)
+    archived = {}
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=EXPORT_PREFETCH_CHUNKS)
+    reader = asyncio.create_task(_prefetch(rows, queue))
+    try:
+        # Document files go in as stored: they are mostly PDFs and images
+        # that don't compress, and it keeps the event loop free of deflate.
+        while (item := await queue.get()) is not None:
+            if item[0] == "start":
+                _, row, size = item
+                name = _archive_name(row)
+                info = _zip_info(name, _timestamp(row['upload_timestamp']), zipfile.ZIP_STORED)
+                entry = archive.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT)
+                archived[row['id']] = name
+            elif item[0] == "data":
+                entry.write(item[1])
+                yield sink.drain()
+            elif item[0] == "end":
+                entry.close()
+                yield sink.drain()
+            else:
+                raise item[1]
+        await reader
+    finally:
+        reader.cancel()
+
+    # Consolidated analyses for the same documents, as JSON and as CSV.
+    first, last = rows[0]['id'] - 1, rows[-1]['id']
+    with archive.open(_zip_info("analyses.json", None, zipfile.ZIP_DEFLATED), "w") as entry:
+        separator = b"["
+        async for row in iter_documents(db, patient_id, after=first, until=last):
+            entry.write(separator + encode_document(row, lambda r: {'file': archived.get(r['id'])}))
+            separator = b","
+            yield sink.drain()
+        entry.write(b"]" if separator == b"," else b"[]")
+
+    with archive.open(_zip_info("analyses.csv", None, zipfile.ZIP_DEFLATED), "w") as entry:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        async for row in iter_documents(db, patient_id, after=first, until=last):
+            writer.writerow(_csv_row(row, archived.get(row['id'], "")))
+            entry.write(buffer.getvalue().encode())
+            buffer.seek(0)
+            buffer.truncate()
+            yield sink.drain()
+        entry.write(buffer.getvalue().encode())
+
+    archive.close()
+    yield sink.drain()
+
+
+async def export_response(db: Prisma, patient_id: int, cursor: int) -> StreamingResponse:
+    """
+    One part of a patient's record as a ZIP built while it is sent: every
+    document file from after cursor, plus analyses.json and analyses.csv
+    for the same documents. Neither the archive nor any whole file is held
+    in memory. X-Next-Cursor is set when more documents remain.
+    """
+    rows = await db.query_raw(_MANIFEST_SQL, patient_id, cursor, EXPORT_PART_DOCUMENTS + 1)
+    part, total = [], 0
+    for row in rows[:EXPORT_PART_DOCUMENTS]:
+        total += row['size'] or 0
+        if part and total > EXPORT_PART_BYTES:
+            break
+        part.append(row)
+
+    suffix = f"-after-{cursor}" if cursor else ""
+    headers = {"Content-Disposition": f'attachment; filename="patient-{patient_id}-record{suffix}.zip"'}
+    if len(part) < len(rows):
+        headers["X-Next-Cursor"] = str(part[-1]['id'])
+    if not part:
+        archive = zipfile.ZipFile(sink := _Sink(), "w")
+        archive.close()
+        return StreamingResponse(iter([sink.drain()]), media_type="application/zip", headers=headers)
+    return StreamingResponse(_archive(db, patient_id, part), media_type="application/zip", headers=headers)
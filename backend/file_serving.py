@@ -0,0 +1,200 @@
+import os
+import hmac
+import time
+import hashlib
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote, urlencode
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from backend.auth import SECRET_KEY
+from backend.blob_store import blob_key
+from backend.storage import LocalStorage, storage
+
+FILE_URL_TTL_SECONDS = int(os.getenv("FILE_URL_TTL_SECONDS", "300"))
+
+# file_response() serves paths rather than storage keys (legacy documents,
+# renditions); a driver rooted at "." reads relative and absolute ones alike.
+_local_files = LocalStorage(Path())
+
+
+def _signature(document_id: int, content_hash: str, filename: str, rendition: str, expires: int) -> str:
+    message = f"{document_id}:{content_hash}:{filename}:{rendition}:{expires}".encode()
+    return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def signed_file_url(document_id: int, content_hash: Optional[str], filename: str,
+                    rendition: str = "", ttl: int = FILE_URL_TTL_SECONDS) -> str:
+    """
+    A short-lived URL for /api/files that needs no Authorization header.
+    For content-addressed documents it is served without touching the DB.
+    """
+    expires = int(time.time()) + ttl
+    content_hash = content_hash or ""
+    params = {'h': content_hash, 'name': filename}
+    if rendition:
+        params['rendition'] = rendition
+    params['expires'] = expires
+    params['signature'] = _signature(document_id, content_hash, filename, rendition, expires)
+    return f"/api/files/{document_id}?{urlencode(params)}"
+
+
+def verify_file_signature(document_id: int, content_hash: str, filename: str,
+                          rendition: str, expires: int, signature: str) -> None:
+    expected = _signature(document_id, content_hash, filename, rendition, expires)
+    if expires < time.time() or not hmac.compare_digest(expected, signature):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid or expired file link",
+        )
+
+
+def _parse_range(header: str, size: int) -> Optional[tuple]:
+    """
+    Parses a single-range "bytes=" header into an inclusive (start, end).
+    Returns None for anything else, in which case the whole file is sent.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start, _, end = spec.strip().partition("-")
+    try:
+        if start:
+            first = int(start)
+            last = int(end) if end else size - 1
+        else:
+            first = max(size - int(end), 0)
+            last = size - 1
+    except ValueError:
+        return None
+    if first >= size or first > last:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return first, min(last, size - 1)
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags or "*" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _headers(filename: str, etag: str, mtime: float, cache_control: str) -> dict:
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(filename)}",
+    }
+
+
+def _requested_range(request: Request, etag: str, size: int) -> Optional[tuple]:
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        return _parse_range(range_header, size)
+    return None
+
+
+async def file_response(request: Request, path: Path, filename: str,
+                        content_hash: Optional[str], cache_control: str = "private, max-age=300"):
+    """
+    Serves a file on local disk with conditional-request and Range support.
+
+    Content-addressed files get a strong ETag of their SHA-256; legacy files
+    fall back to a weak size/mtime tag. Whole-file responses go through
+    FileResponse, which uses the server's zero-copy path send where the ASGI
+    server supports it.
+    """
+    try:
+        stat = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    etag = f'"{content_hash}"' if content_hash else f'W/"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    headers = _headers(filename, etag, stat.st_mtime, cache_control)
+
+    if _not_modified(request, etag.removeprefix("W/"), stat.st_mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range = _requested_range(request, etag, stat.st_size)
+    if byte_range is not None:
+        first, last = byte_range
+        headers["Content-Range"] = f"bytes {first}-{last}/{stat.st_size}"
+        headers["Content-Length"] = str(last - first + 1)
+        return StreamingResponse(
+            _local_files.read_range(str(path), first, last),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    return FileResponse(path, headers=headers, media_type=media_type, stat_result=stat)
+
+
+async def blob_response(request: Request, content_hash: str, filename: str,
+                        cache_control: str = "private, max-age=300"):
+    """
+    Serves a content-addressed blob from whichever storage backend holds it.
+    Local files go through file_response(); remote objects are streamed
+    through with the same ETag, conditional and Range handling.
+    """
+    key = blob_key(content_hash)
+    path = storage.local_path(key)
+    if path is not None:
+        return await file_response(request, path, filename, content_hash, cache_control)
+
+    # The hash is the ETag, so a revalidation needs no round trip to storage.
+    etag = f'"{content_hash}"'
+    if "if-none-match" in request.headers and _not_modified(request, etag, 0):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag, "Cache-Control": cache_control},
+        )
+
+    info = await storage.stat(key)
+    if info is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = _headers(filename, etag, info.mtime, cache_control)
+    if _not_modified(request, etag, info.mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    first, last = 0, info.size - 1
+    status_code = status.HTTP_200_OK
+    byte_range = _requested_range(request, etag, info.size) if info.size else None
+    if byte_range is not None:
+        first, last = byte_range
+        headers["Content-Range"] = f"bytes {first}-{last}/{info.size}"
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+    headers["Content-Length"] = str(last - first + 1)
+    body = storage.read_range(key, first, last) if info.size else iter(())
+    return StreamingResponse(body, status_code=status_code, media_type=media_type, headers=headers)
+
+
+async def document_response(request: Request, document, cache_control: str = "private, max-age=300"):
+    """
+    Serves a document's file, wherever it is stored.
+    """
+    filename = document.filename or Path(document.file_path).name
+    if document.content_hash:
+        return await blob_response(request, document.content_hash, filename, cache_control)
+    return await file_response(request, Path(document.file_path), filename, None, cache_control)
@@ -0,0 +1,90 @@
+"""
+CPU-bound model implementations that run inside executor worker processes.
+
+Models are looked up by name in MODELS, constructed once per process by
+get_model() and kept warm for every later call in that process.
+"""
+import os
+import zlib
+from pathlib import Path
+
+STANDIN_SAMPLE_BYTES = int(os.getenv("STANDIN_SAMPLE_BYTES", str(256 * 1024)))
+STANDIN_ROUNDS = int(os.getenv("STANDIN_ROUNDS", "4"))
+
+
+class StandInModel:
+    """
+    A deterministic, pure-Python stand-in for Tesseract/ONNX style inference.
+
+    It holds the GIL for the whole call, like real CPU inference does, so it
+    makes the cost of running such models on the event loop measurable
+    without a GPU or model weights.
+    """
+
+    def __init__(self, rounds: int = STANDIN_ROUNDS, sample_bytes: int = STANDIN_SAMPLE_BYTES):
+        self.rounds = rounds
+        self.sample_bytes = sample_bytes
+        # Stands in for loading weights: expensive enough that reloading it
+        # per call would show up in benchmarks.
+        self.weights = [[(i * 31 + j * 17 + 7) % 251 for j in range(256)] for i in range(256)]
+
+    def _score(self, file_path: str) -> tuple:
+        with open(file_path, "rb") as f:
+            data = f.read(self.sample_bytes)
+        weights = self.weights
+        state = 0
+        histogram = [0] * 256
+        for _ in range(self.rounds):
+            for byte in data:
+                state = weights[state][byte]
+                histogram[state] += 1
+        return state, histogram, zlib.crc32(data)
+
+    def predict(self, file_path: str):
+        raise NotImplementedError
+
+
+class StandInOcrModel(StandInModel):
+    def predict(self, file_path: str) -> str:
+        state, _, checksum = self._score(file_path)
+        return (
+            f"Text extracted from {Path(file_path).name} "
+            f"(stand-in OCR, state {state}, crc {checksum:08x})."
+        )
+
+
+class StandInCvModel(StandInModel):
+    def predict(self, file_path: str) -> dict:
+        state, histogram, _ = self._score(file_path)
+        total = sum(histogram) or 1
+        confidence = round(max(histogram) / total, 4)
+        return {
+            "classification": "Abnormal" if state % 2 else "Normal",
+            "confidence": confidence,
+            "heatmap_url": None,
+        }
+
+
+MODELS = {
+    "ocr": StandInOcrModel,
+    "cv": StandInCvModel,
+}
+
+_loaded = {}
+
+
+def get_model(name: str):
+    model = _loaded.get(name)
+    if model is None:
+        model = _loaded[name] = MODELS[name]()
+    return model
+
+
+def warm_up(names) -> None:
+    """Executor initializer: loads models before the first task arrives."""
+    for name in names:
+        get_model(name)
+
+
+def predict(name: str, file_path: str):
+    return get_model(name).predict(file_path)
@@ -0,0 +1,152 @@
+import os
+import uuid
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+
+@dataclass
+class IngestedFile:
+    path: Path
+    sha256: str
+    size: int
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File exceeds the maximum upload size of {max_bytes} bytes",
+    )
+
+
+def _write_chunk(buffer: BinaryIO, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    buffer.write(chunk)
+
+
+def _finalize(buffer: BinaryIO, temp_path: Path, destination: Path) -> None:
+    buffer.flush()
+    os.fsync(buffer.fileno())
+    buffer.close()
+    os.replace(temp_path, destination)
+
+
+def _discard(buffer: BinaryIO, temp_path: Path) -> None:
+    buffer.close()
+    temp_path.unlink(missing_ok=True)
+
+
+async def stream_to_disk(
+    upload: UploadFile,
+    destination: Path,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> IngestedFile:
+    """
+    Copies an UploadFile to destination in fixed-size chunks without blocking
+    the event loop, hashing as it goes.
+
+    Data lands in a temp file next to destination and is renamed into place
+    only once complete, so readers never see a partial file.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    temp_path = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+
+    buffer = await run_in_threadpool(temp_path.open, "wb")
+    try:
+        while chunk := await upload.read(chunk_size):
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            await run_in_threadpool(_write_chunk, buffer, digest, chunk)
+        await run_in_threadpool(_finalize, buffer, temp_path, destination)
+    except BaseException:
+        await run_in_threadpool(_discard, buffer, temp_path)
+        raise
+
+    return IngestedFile(path=destination, sha256=digest.hexdigest(), size=size)
+
+
+class _BodyTooLarge(BaseException):
+    # BaseException so FastAPI's body parsing doesn't turn it into a 400.
+    pass
+
+
+class MaxBodySizeMiddleware:
+    """
+    Rejects upload requests whose body exceeds the limit for their path
+    prefix before the multipart parser spools them to disk.
+
+    Declared Content-Length is checked up front; chunked bodies are counted as
+    they stream in and cut off as soon as they pass the limit.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        # Longest prefix first so a more specific path can raise the limit.
+        self.limits = sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _limit_for(self, path: str):
+        for prefix, max_bytes in self.limits:
+            if path.startswith(prefix):
+                return max_bytes
+        return None
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self._limit_for(scope["path"]) if scope["type"] == "http" else None
+        if max_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Multipart framing adds a little on top of the file itself.
+        limit = max_bytes + 64 * 1024
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(scope, receive, send, max_bytes)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(scope, receive, send, max_bytes)
+
+    async def _reject(self, scope, receive, send, max_bytes: int):
+        response = JSONResponse(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            content={"detail": f"Upload exceeds the maximum size of {max_bytes} bytes"},
+            headers={"Connection": "close"},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,76 @@
+import os
+import time
+import secrets
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import PlainTextResponse
+
+from backend import metrics
+
+# Optional bearer token for /metrics, for deployments where the scraper
+# can reach the API from outside.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+REQUEST_SECONDS = metrics.Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to finishing its response.",
+    ("method", "route", "status"),
+)
+REQUESTS_IN_FLIGHT = metrics.Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled.",
+    ("method",),
+)
+DB_QUERY_SECONDS = metrics.Histogram(
+    "db_query_duration_seconds",
+    "Prisma query time, including the round trip to the query engine.",
+    ("operation",),
+)
+
+
+class MetricsMiddleware:
+    """
+    Records per-route latency and in-flight requests. Routes are labelled by
+    their path template ("/api/doctor/patients/{patient_id}/documents"), so
+    the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        started = time.perf_counter()
+
+        async def recording_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(method)
+        try:
+            await self.app(scope, receive, recording_send)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(method)
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method, getattr(route, "path", "unmatched"), str(status_code),
+            )
+
+
+async def metrics_endpoint(request: Request):
+    """
+    Prometheus scrape endpoint.
+    """
+    if METRICS_TOKEN:
+        supplied = request.headers.get("authorization", "")
+        if not secrets.compare_digest(supplied, f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
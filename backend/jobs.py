@@ -0,0 +1,403 @@
+import os
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from typing import Optional
+
+from backend.prisma_db import db
+from backend.prisma_client import Json, Prisma
+from backend import services, blob_store, search_index, timeline, metrics
+from backend.admission import AdmissionController
+from backend.events import hub
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "3"))
+ANALYSIS_LEASE_SECONDS = int(os.getenv("ANALYSIS_LEASE_SECONDS", "300"))
+ANALYSIS_POLL_SECONDS = float(os.getenv("ANALYSIS_POLL_SECONDS", "2"))
+ANALYSIS_RETRY_BASE_SECONDS = int(os.getenv("ANALYSIS_RETRY_BASE_SECONDS", "5"))
+# Admission budgets: queued + running jobs overall and per patient, and how
+# many of one patient's jobs may run at once so a bulk upload can't starve
+# everyone else's.
+ANALYSIS_QUEUE_LIMIT = int(os.getenv("ANALYSIS_QUEUE_LIMIT", "2000"))
+ANALYSIS_PATIENT_QUEUE_LIMIT = int(os.getenv("ANALYSIS_PATIENT_QUEUE_LIMIT", "500"))
+ANALYSIS_PATIENT_WORKERS = int(os.getenv("ANALYSIS_PATIENT_WORKERS", "2"))
+
+# Claims the oldest runnable job of a patient with fewer than $2 jobs
+# running. SKIP LOCKED lets any number of workers, in this process or others,
+# poll the same table without handing out a job twice.
+_CLAIM_SQL = """
+UPDATE analysis_jobs
+SET status = 'running', attempts = attempts + 1,
+    locked_at = now(), locked_by = $1, updated_at = now()
+WHERE id = (
+    SELECT j.id FROM analysis_jobs j
+    JOIN medical_documents d ON d.id = j.document_id
+    WHERE j.status = 'queued' AND j.run_after <= now()
+      AND (
+          SELECT count(*) FROM analysis_jobs r
+          JOIN medical_documents rd ON rd.id = r.document_id
+          WHERE r.status = 'running' AND rd.patient_id = d.patient_id
+      ) < $2
+    ORDER BY j.run_after, j.id
+    FOR UPDATE OF j SKIP LOCKED
+    LIMIT 1
+)
+RETURNING id, document_id, attempts, max_attempts
+"""
+
+_HEARTBEAT_SQL = """
+UPDATE analysis_jobs SET locked_at = now(), updated_at = now()
+WHERE id = $1 AND locked_by = $2
+"""
+
+# Jobs whose lease expired belong to a worker that crashed or was killed.
+_RECOVER_SQL = """
+UPDATE analysis_jobs
+SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+    last_error = COALESCE(last_error, 'worker lease expired'),
+    locked_at = NULL, locked_by = NULL, run_after = now(), updated_at = now()
+WHERE status = 'running' AND locked_at < now() - ($1::int * interval '1 second')
+RETURNING document_id, status
+"""
+
+_RETRY_SQL = """
+UPDATE analysis_jobs
+SET status = 'queued', last_error = $2, locked_at = NULL, locked_by = NULL,
+    run_after = now() + ($3::int * interval '1 second'), updated_at = now()
+WHERE id = $1
+"""
+
+_FINISH_SQL = """
+UPDATE analysis_jobs
+SET status = $2, last_error = $3, locked_at = NULL, locked_by = NULL, updated_at = now()
+WHERE id = $1
+"""
+
+# Documents uploaded before analysis_status existed took its 'pending'
+# default and have no job. Those with an analysis are processed; the rest
+# get a job. Only rows without any job are touched, so rerunning this at
+# every startup changes nothing once they are settled.
+_LEGACY_PROCESSED_SQL = """
+UPDATE medical_documents d SET analysis_status = 'processed'
+WHERE d.analysis_status = 'pending' AND d.ai_analysis_json IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM analysis_jobs j WHERE j.document_id = d.id)
+"""
+
+_LEGACY_QUEUE_SQL = """
+INSERT INTO analysis_jobs (document_id, max_attempts)
+SELECT d.id, $1 FROM medical_documents d
+WHERE d.analysis_status = 'pending' AND d.ai_analysis_json IS NULL
+  AND NOT EXISTS (SELECT 1 FROM analysis_jobs j WHERE j.document_id = d.id)
+"""
+
+
+async def settle_legacy_documents(db: Prisma) -> None:
+    processed = await db.execute_raw(_LEGACY_PROCESSED_SQL)
+    queued = await db.execute_raw(_LEGACY_QUEUE_SQL, ANALYSIS_MAX_ATTEMPTS)
+    if processed or queued:
+        logger.info("Marked %d legacy documents processed, queued %d for analysis", processed, queued)
+
+
+async def record_analysis(db: Prisma, document_id: int, patient_id: Optional[int], analysis) -> None:
+    """
+    Updates everything derived from a finished analysis.
+    """
+    await search_index.index_document(db, document_id, patient_id, analysis)
+    await timeline.record_entities(db, document_id, analysis)
+
+
+async def record_analyses(db: Prisma, document_ids: list) -> None:
+    """
+    record_analysis for documents that were created already processed.
+    """
+    if not document_ids:
+        return
+    documents = await db.medicaldocument.find_many(where={'id': {'in': document_ids}})
+    for document in documents:
+        await record_analysis(db, document.id, document.patient_id, document.ai_analysis_json)
+
+
+async def enqueue_analysis(
+    db: Prisma,
+    patient_id: int,
+    file_path: str,
+    filename: str,
+    content_hash: Optional[str] = None,
+):
+    """
+    Inserts a MedicalDocument for an uploaded file.
+
+    If the same content was already analyzed by the current pipeline the
+    cached result is attached straight away; otherwise the document is
+    created pending together with its analysis job.
+    """
+    data = {
+        'patient_id': patient_id,
+        'file_path': file_path,
+        'filename': filename,
+        'content_hash': content_hash,
+    }
+
+    cached = await blob_store.cached_analysis(db, content_hash, services.PIPELINE_VERSION)
+    if cached is not None:
+        document = await db.medicaldocument.create(
+            data={**data, 'ai_analysis_json': Json(cached), 'analysis_status': 'processed'}
+        )
+        await record_analysis(db, document.id, patient_id, cached)
+        return document
+
+    document = await db.medicaldocument.create(
+        data={
+            **data,
+            'analysis_status': 'pending',
+            'analysis_jobs': {
+                'create': [{'max_attempts': ANALYSIS_MAX_ATTEMPTS}],
+            },
+        }
+    )
+    worker_pool.notify()
+    return document
+
+
+# Inserts every document of a batch and the jobs for those without a cached
+# analysis in a single statement. Ids follow the ORDER BY of the source rows,
+# which is how callers map results back to their input.
+_ENQUEUE_BATCH_SQL = """
+WITH docs AS (
+    INSERT INTO medical_documents
+        (patient_id, file_path, filename, content_hash, analysis_status, ai_analysis_json)
+    SELECT $1, f.file_path, f.filename, f.content_hash,
+           CASE WHEN c.result IS NULL THEN 'pending' ELSE 'processed' END,
+           CASE WHEN jsonb_typeof(c.result) = 'string' THEN (c.result #>> '{}')::jsonb ELSE c.result END
+    FROM unnest($2::text[], $3::text[], $4::text[])
+         WITH ORDINALITY AS f(file_path, filename, content_hash, ord)
+    LEFT JOIN analysis_cache c
+           ON c.content_hash = f.content_hash AND c.pipeline_version = $5
+    ORDER BY f.ord
+    RETURNING id, filename, upload_timestamp, analysis_status
+), queued AS (
+    INSERT INTO analysis_jobs (document_id, max_attempts)
+    SELECT id, $6 FROM docs WHERE analysis_status = 'pending'
+)
+SELECT id, filename, upload_timestamp, analysis_status FROM docs ORDER BY id
+"""
+
+
+async def enqueue_analysis_batch(db: Prisma, patient_id: int, files: list) -> list:
+    """
+    Bulk version of enqueue_analysis. files holds (file_path, filename,
+    content_hash) tuples; returns the inserted rows in the same order.
+    """
+    if not files:
+        return []
+    file_paths, filenames, hashes = (list(column) for column in zip(*files))
+    rows = await db.query_raw(
+        _ENQUEUE_BATCH_SQL,
+        patient_id, file_paths, filenames, hashes,
+        services.PIPELINE_VERSION, ANALYSIS_MAX_ATTEMPTS,
+    )
+    worker_pool.notify()
+    await record_analyses(db, [row['id'] for row in rows if row['analysis_status'] == 'processed'])
+    return rows
+
+
+class AnalysisWorkerPool:
+    """
+    A bounded pool of asyncio workers draining the analysis_jobs table.
+    """
+
+    def __init__(self, db: Prisma, concurrency: int = ANALYSIS_WORKERS):
+        self.db = db
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        await self.recover_expired()
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(n)) for n in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._reaper_loop()))
+        logger.info("Started %d analysis workers as %s", self.concurrency, self.worker_id)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def recover_expired(self) -> int:
+        rows = await self.db.query_raw(_RECOVER_SQL, ANALYSIS_LEASE_SECONDS)
+        for row in rows:
+            status = 'failed' if row['status'] == 'failed' else 'pending'
+            await self._set_document_status(row['document_id'], status)
+        if rows:
+            logger.warning("Recovered %d analysis jobs with expired leases", len(rows))
+            self.notify()
+        return len(rows)
+
+    async def _claim(self) -> Optional[dict]:
+        rows = await self.db.query_raw(_CLAIM_SQL, self.worker_id, ANALYSIS_PATIENT_WORKERS)
+        return rows[0] if rows else None
+
+    async def _wait_for_work(self) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=ANALYSIS_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _worker_loop(self, n: int) -> None:
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Analysis worker %d failed to claim a job", n)
+                job = None
+
+            if job is None:
+                await self._wait_for_work()
+                continue
+
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # The job keeps its lease; recover_expired requeues it.
+                logger.exception("Analysis worker %d failed on job %d", n, job['id'])
+
+    async def _reaper_loop(self) -> None:
+        while True:
+            await asyncio.sleep(ANALYSIS_LEASE_SECONDS / 2)
+            try:
+                await self.recover_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to recover expired analysis jobs")
+
+    async def _heartbeat(self, job_id: int) -> None:
+        while True:
+            await asyncio.sleep(ANALYSIS_LEASE_SECONDS / 3)
+            try:
+                await self.db.execute_raw(_HEARTBEAT_SQL, job_id, self.worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to renew the lease of analysis job %d", job_id)
+
+    async def _set_document_status(self, document_id: int, status: str) -> None:
+        await self.db.medicaldocument.update_many(
+            where={'id': document_id},
+            data={'analysis_status': status},
+        )
+
+    async def _audience(self, patient_id: Optional[int]) -> list:
+        """
+        The patient and every linked doctor, looked up only if anyone is
+        listening for events on this process.
+        """
+        if patient_id is None or not hub.has_subscribers():
+            return []
+        links = await self.db.doctorpatient.find_many(
+            where={'patient_id': patient_id, 'doctor_id': {'not': None}}
+        )
+        return [patient_id, *(link.doctor_id for link in links)]
+
+    async def _run(self, job: dict) -> None:
+        job_id, document_id = job['id'], job['document_id']
+        document = await self.db.medicaldocument.find_unique(where={'id': document_id})
+        if document is None:
+            await self.db.execute_raw(_FINISH_SQL, job_id, 'done', 'document deleted')
+            return
+
+        audience = await self._audience(document.patient_id)
+
+        def publish(status: str, **extra) -> None:
+            if audience:
+                hub.publish(audience, "analysis", {
+                    'document_id': document_id,
+                    'patient_id': document.patient_id,
+                    'status': status,
+                    **extra,
+                })
+
+        # An identical upload may have finished analysis since this one was queued.
+        cached = await blob_store.cached_analysis(
+            self.db, document.content_hash, services.PIPELINE_VERSION
+        )
+        if cached is not None:
+            await self._complete(job_id, document, cached)
+            publish('processed')
+            return
+
+        def on_stage(stage: str, succeeded: bool, timing: dict) -> None:
+            publish('stage_done' if succeeded else 'stage_failed', stage=stage, seconds=timing['seconds'])
+
+        await self._set_document_status(document_id, 'running')
+        publish('running')
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        started = time.perf_counter()
+        try:
+            async with blob_store.local_file(document.content_hash, document.file_path) as path:
+                analysis = await services.analyze_document(str(path), document.content_hash, on_stage)
+            admission.observe(time.perf_counter() - started)
+        except asyncio.CancelledError:
+            # Leave the lease in place; recover_expired requeues the job.
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job['attempts'] >= job['max_attempts']:
+                logger.error("Analysis of document %d failed permanently: %s", document_id, error)
+                await self.db.execute_raw(_FINISH_SQL, job_id, 'failed', error)
+                await self._set_document_status(document_id, 'failed')
+                publish('failed', error=error)
+            else:
+                delay = ANALYSIS_RETRY_BASE_SECONDS * 2 ** (job['attempts'] - 1)
+                logger.warning("Analysis of document %d failed, retrying in %ds: %s", document_id, delay, error)
+                await self.db.execute_raw(_RETRY_SQL, job_id, error, delay)
+                await self._set_document_status(document_id, 'pending')
+                publish('retrying', error=error, retry_in=delay)
+            return
+        finally:
+            heartbeat.cancel()
+
+        if document.content_hash:
+            await blob_store.store_analysis(
+                self.db, document.content_hash, services.PIPELINE_VERSION, analysis
+            )
+        await self._complete(job_id, document, analysis)
+        publish('processed')
+
+    async def _complete(self, job_id: int, document, result: dict) -> None:
+        updated = await self.db.medicaldocument.update_many(
+            where={'id': document.id},
+            data={
+                'ai_analysis_json': Json(result),
+                'analysis_status': 'processed',
+            },
+        )
+        # The patient may have deleted the document while it was analyzed.
+        if updated:
+            await record_analysis(self.db, document.id, document.patient_id, result)
+        await self.db.execute_raw(_FINISH_SQL, job_id, 'done', None)
+
+
+worker_pool = AnalysisWorkerPool(db)
+admission = AdmissionController(
+    ANALYSIS_QUEUE_LIMIT, ANALYSIS_PATIENT_QUEUE_LIMIT, ANALYSIS_WORKERS, ANALYSIS_PATIENT_WORKERS
+)
+metrics.register("analysis_admission", admission.stats)
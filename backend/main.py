@@ -7,10 +7,19 @@ if not env_path.exists():
     env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(dotenv_path=env_path, override=True)
 
+from backend.logging_config import configure_logging
+configure_logging()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from backend.api import auth_router, patient_router, doctor_router, linking_router
+from backend.api import auth_router, patient_router, doctor_router, linking_router, admin_router, files_router
 from backend.prisma_db import db
+from backend.jobs import settle_legacy_documents, worker_pool
+from backend.backfill import backfill_runner
+from backend.executors import cpu_executor
+from backend import access_codes, search_index
+from backend.ingest import MaxBodySizeMiddleware, MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES
+from backend.instrumentation import MetricsMiddleware, metrics_endpoint
 
 google_client_id = os.getenv('GOOGLE_CLIENT_ID')
 if google_client_id:
@@ -24,9 +33,19 @@ app = FastAPI(title="IntelliMed AI")
 async def startup():
     await db.connect()
     print("✓ Database connected")
+    await search_index.ensure_indexes(db)
+    await access_codes.ensure_indexes(db)
+    await settle_legacy_documents(db)
+    access_codes.access_code_sweeper.start()
+    await worker_pool.start()
+    print(f"✓ Analysis workers started ({worker_pool.concurrency})")
 
 @app.on_event("shutdown")
 async def shutdown():
+    await backfill_runner.stop(cancel=True)
+    await access_codes.access_code_sweeper.stop()
+    await worker_pool.stop()
+    cpu_executor.shutdown()
     if db.is_connected():
         await db.disconnect()
         print("✓ Database disconnected")
@@ -39,6 +58,14 @@ origins = [
     "http://127.0.0.1:3001",
 ]
 
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    limits={
+        "/api/patient/upload": MAX_UPLOAD_BYTES,
+        "/api/patient/upload/batch": MAX_BATCH_UPLOAD_BYTES,
+    },
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -48,10 +75,16 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Outermost, so the timings include the other middleware.
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth_router.router, prefix="/api/auth", tags=["auth"])
 app.include_router(patient_router.router, prefix="/api/patient", tags=["patient"])
 app.include_router(doctor_router.router, prefix="/api/doctor", tags=["doctor"])
 app.include_router(linking_router.router, prefix="/api", tags=["linking"])
+app.include_router(files_router.router, prefix="/api/files", tags=["files"])
+app.include_router(admin_router.router, prefix="/api/admin", tags=["admin"])
+app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,142 @@
+import re
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Sequence, Tuple
+
+_providers: Dict[str, Callable[[], dict]] = {}
+_collectors: list = []
+
+PREFIX = "intellimed"
+
+# Seconds; covers sub-millisecond cache hits up to slow analysis stages.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def register(name: str, provider: Callable[[], dict]) -> None:
+    """
+    Registers a component's stats() callable under name.
+    """
+    _providers[name] = provider
+
+
+def snapshot() -> Dict[str, dict]:
+    return {name: provider() for name, provider in _providers.items()}
+
+
+# Metrics are only updated from the event loop (or with the GIL held for a
+# single dict/list operation), so none of them take locks.
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = f"{PREFIX}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _collectors.append(self)
+
+    def _labels(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self._samples(),
+        ]
+
+    def _samples(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> list:
+        return [f"{self.name}{self._labels(key)} {_number(value)}" for key, value in list(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last one is +Inf), sum].
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def _samples(self) -> list:
+        lines = []
+        for key, (counts, total) in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = 'le="%s"' % ("+Inf" if bound == math.inf else _number(bound))
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _flatten(prefix: str, stats: dict, out: list) -> None:
+    for key, value in stats.items():
+        name = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', str(key))}"
+        if isinstance(value, dict):
+            _flatten(name, value, out)
+        elif isinstance(value, (int, float)):
+            out.append((name, int(value) if isinstance(value, bool) else value))
+
+
+def render_prometheus() -> str:
+    """
+    Every metric plus the registered component stats (as gauges) in the
+    Prometheus text exposition format.
+    """
+    lines = []
+    for collector in list(_collectors):
+        lines.extend(collector.render())
+    for component, provider in list(_providers.items()):
+        flat = []
+        _flatten(f"{PREFIX}_{component}", provider(), flat)
+        for name, value in flat:
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
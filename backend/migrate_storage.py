@@ -0,0 +1,162 @@
+"""
+Moves files into the configured storage backend (STORAGE_BACKEND):
+
+    python -m backend.migrate_storage [--batch-size 100] [--concurrency 8]
+        [--after-id 0] [--delete-sources]
+        [--from-local ./uploads] [--after-sha ""]
+
+Legacy documents, stored at a path of their own before uploads became
+content-addressed, are hashed and put into storage as blobs; their
+content_hash and file_path are then switched over in one statement, so a
+document never points at a missing file. With --delete-sources the old files
+are removed once their document has been switched.
+
+With --from-local, every blob not yet present in storage is also copied from
+a local blob directory, e.g. when moving an existing ./uploads to S3.
+
+Both walks go in key order and print the last key of each finished batch;
+rerun with --after-id / --after-sha to resume an interrupted migration.
+Files that are already migrated are skipped, so a plain rerun is also safe.
+"""
+import argparse
+import asyncio
+import hashlib
+from pathlib import Path
+from dotenv import load_dotenv
+
+env_path = Path(__file__).parent / '.env'
+if not env_path.exists():
+    env_path = Path(__file__).parent.parent / '.env'
+load_dotenv(dotenv_path=env_path, override=True)
+
+from starlette.concurrency import run_in_threadpool
+
+from backend.prisma_db import db
+from backend.ingest import IngestedFile
+from backend import blob_store
+from backend.storage import storage
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_LEGACY_SQL = """
+SELECT id, file_path FROM medical_documents
+WHERE content_hash IS NULL AND id > $1
+ORDER BY id
+LIMIT $2
+"""
+
+# The name is taken from the old path while it is still there, so the
+# document keeps being listed and downloaded under it.
+_SWITCH_SQL = """
+UPDATE medical_documents
+SET content_hash = $2, file_path = $3,
+    filename = COALESCE(filename, regexp_replace(file_path, '^.*/', ''))
+WHERE id = $1 AND content_hash IS NULL
+"""
+
+_BLOBS_SQL = """
+SELECT sha256 FROM blobs WHERE sha256 > $1 ORDER BY sha256 LIMIT $2
+"""
+
+
+def _hash_file(path: Path) -> IngestedFile:
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    return IngestedFile(path=path, sha256=digest.hexdigest(), size=size)
+
+
+async def migrate_document(document_id: int, file_path: str, delete_source: bool) -> bool:
+    path = Path(file_path)
+    try:
+        ingested = await run_in_threadpool(_hash_file, path)
+    except FileNotFoundError:
+        print(f"  document {document_id}: {file_path} is missing, skipped")
+        return False
+
+    key = await blob_store.commit(db, ingested, move=False)
+    # The document may have been deleted (or migrated) in the meantime.
+    if not await db.execute_raw(_SWITCH_SQL, document_id, ingested.sha256, key):
+        await blob_store.release(db, ingested.sha256)
+        return False
+    if delete_source:
+        await run_in_threadpool(path.unlink, True)
+    return True
+
+
+async def migrate_legacy(batch_size: int, concurrency: int, after_id: int, delete_sources: bool) -> int:
+    slots = asyncio.Semaphore(concurrency)
+    migrated = 0
+
+    async def migrate(row) -> bool:
+        async with slots:
+            return await migrate_document(row['id'], row['file_path'], delete_sources)
+
+    while True:
+        rows = await db.query_raw(_LEGACY_SQL, after_id, batch_size)
+        if not rows:
+            break
+        outcomes = await asyncio.gather(*(migrate(row) for row in rows))
+        migrated += sum(outcomes)
+        after_id = rows[-1]['id']
+        print(f"Migrated {migrated} legacy documents (last id {after_id})")
+    return migrated
+
+
+async def copy_blobs(source: Path, batch_size: int, concurrency: int, after_sha: str) -> int:
+    slots = asyncio.Semaphore(concurrency)
+    copied = 0
+
+    async def copy(sha256: str) -> bool:
+        key = blob_store.blob_key(sha256)
+        async with slots:
+            if await storage.exists(key):
+                return False
+            local = source / key
+            if not await run_in_threadpool(local.exists):
+                print(f"  blob {sha256}: {local} is missing, skipped")
+                return False
+            await storage.put(key, local, move=False)
+            return True
+
+    while True:
+        rows = await db.query_raw(_BLOBS_SQL, after_sha, batch_size)
+        if not rows:
+            break
+        outcomes = await asyncio.gather(*(copy(row['sha256']) for row in rows))
+        copied += sum(outcomes)
+        after_sha = rows[-1]['sha256']
+        print(f"Copied {copied} blobs (last sha {after_sha})")
+    return copied
+
+
+async def migrate(args) -> tuple:
+    await db.connect()
+    try:
+        copied = 0
+        if args.from_local:
+            copied = await copy_blobs(Path(args.from_local), args.batch_size, args.concurrency, args.after_sha)
+        migrated = await migrate_legacy(args.batch_size, args.concurrency, args.after_id, args.delete_sources)
+    finally:
+        await db.disconnect()
+    return copied, migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--after-id", type=int, default=0)
+    parser.add_argument("--delete-sources", action="store_true", help="remove legacy files once migrated")
+    parser.add_argument("--from-local", help="local blob directory to copy missing blobs from")
+    parser.add_argument("--after-sha", default="")
+    args = parser.parse_args()
+    copied, migrated = asyncio.run(migrate(args))
+    print(f"✓ Copied {copied} blobs, migrated {migrated} legacy documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import time
+import asyncio
+
+from fastapi import HTTPException, status
+
+from backend.prisma_client import Prisma
+from backend.cache import TTLCache
+from backend.schemas import User
+from backend import metrics
+
+# Each doctor's linked patient ids, loaded in one query. Link changes made
+# through this process invalidate the entry at once; the TTL bounds how long
+# another process can keep a removed link. Refused checks are remembered for
+# PATIENT_LINK_REFUSAL_TTL, which bounds how long a link made through another
+# process can still be refused.
+PATIENT_LINK_CACHE_SIZE = int(os.getenv("PATIENT_LINK_CACHE_SIZE", "10000"))
+PATIENT_LINK_CACHE_TTL = float(os.getenv("PATIENT_LINK_CACHE_TTL", "60"))
+PATIENT_LINK_REFUSAL_TTL = float(os.getenv("PATIENT_LINK_REFUSAL_TTL", "5"))
+
+_LINKED_SQL = """
+SELECT patient_id FROM doctor_patient WHERE doctor_id = $1
+"""
+
+PATIENT_LINK_CHECK_SECONDS = metrics.Histogram(
+    "patient_link_check_duration_seconds",
+    "Doctor-to-patient authorization checks, by where the answer came from.",
+    ("source",),
+)
+
+
+class PatientLinks:
+    def __init__(self, maxsize: int = PATIENT_LINK_CACHE_SIZE, ttl: float = PATIENT_LINK_CACHE_TTL,
+                 refusal_ttl: float = PATIENT_LINK_REFUSAL_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Each doctor's recently refused patient ids.
+        self._refused = TTLCache(maxsize=maxsize, ttl=refusal_ttl)
+        self._loading: dict = {}
+        # Counted here rather than by the cache, which sees a cached set as
+        # a hit even when the patient isn't in it and the database is asked.
+        self.hits = 0
+        self.misses = 0
+
+    async def _load(self, db: Prisma, doctor_id: int) -> frozenset:
+        rows = await db.query_raw(_LINKED_SQL, doctor_id)
+        patient_ids = frozenset(row['patient_id'] for row in rows)
+        # invalidate() forgets the load, so one that raced with a link
+        # change doesn't cache what it read before the change.
+        if self._loading.get(doctor_id) is asyncio.current_task():
+            self.cache.set(doctor_id, patient_ids)
+        return patient_ids
+
+    async def _fetch(self, db: Prisma, doctor_id: int) -> frozenset:
+        # Concurrent misses for one doctor share a single query.
+        task = self._loading.get(doctor_id)
+        if task is None:
+            task = self._loading[doctor_id] = asyncio.ensure_future(self._load(db, doctor_id))
+
+            def forget(done):
+                if self._loading.get(doctor_id) is done:
+                    del self._loading[doctor_id]
+
+            task.add_done_callback(forget)
+        return await asyncio.shield(task)
+
+    async def patient_ids(self, db: Prisma, doctor_id: int) -> frozenset:
+        """
+        Ids of every patient linked to doctor_id.
+        """
+        patient_ids = self.cache.get(doctor_id)
+        if patient_ids is None:
+            self.misses += 1
+            return await self._fetch(db, doctor_id)
+        self.hits += 1
+        return patient_ids
+
+    async def is_linked(self, db: Prisma, doctor_id: int, patient_id: int) -> bool:
+        started = time.perf_counter()
+        patient_ids = self.cache.get(doctor_id)
+        source = "cache"
+        if patient_ids is not None and patient_id in patient_ids:
+            linked = True
+        elif patient_id in self._refused.get(doctor_id, ()):
+            linked = False
+        else:
+            # A miss, or a link made through another process since the set
+            # was cached: only a fresh read can refuse access.
+            patient_ids = await self._fetch(db, doctor_id)
+            linked = patient_id in patient_ids
+            # Only remembered if no link change came in during the read.
+            if not linked and self.cache.get(doctor_id) is patient_ids:
+                self._refuse(doctor_id, patient_id)
+            source = "database"
+        if source == "cache":
+            self.hits += 1
+        else:
+            self.misses += 1
+        PATIENT_LINK_CHECK_SECONDS.observe(time.perf_counter() - started, source)
+        return linked
+
+    def _refuse(self, doctor_id: int, patient_id: int) -> None:
+        # Added to the doctor's entry without extending it, so a refusal is
+        # never kept longer than the refusal TTL.
+        refused = self._refused.get(doctor_id)
+        if refused is None:
+            self._refused.set(doctor_id, {patient_id})
+        else:
+            refused.add(patient_id)
+
+    def invalidate(self, doctor_id: int) -> None:
+        """
+        Forgets a doctor's cached links. Call after linking or unlinking.
+        """
+        self.cache.pop(doctor_id)
+        self._refused.pop(doctor_id)
+        self._loading.pop(doctor_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            **self.cache.stats(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'refusals': len(self._refused),
+        }
+
+
+patient_links = PatientLinks()
+metrics.register("patient_link_cache", patient_links.stats)
+
+
+async def require_patient_link(db: Prisma, current_user: User, patient_id: int) -> None:
+    if current_user.role != 'doctor':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only doctors can view patient documents",
+        )
+
+    if not await patient_links.is_linked(db, current_user.id, patient_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this patient's documents",
+        )
@@ -0,0 +1,217 @@
+import time
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from backend.cache import TTLCache
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = metrics.Histogram(
+    "pipeline_stage_duration_seconds",
+    "Time spent in each pipeline stage, including retries.",
+    ("stage", "outcome"),
+)
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 1
+    backoff: float = 0.5
+    multiplier: float = 2.0
+
+    def delay(self, attempt: int) -> float:
+        return self.backoff * self.multiplier ** (attempt - 1)
+
+
+@dataclass
+class Stage:
+    """
+    One step of a Pipeline.
+
+    inputs names either other stages, whose outputs are passed positionally
+    in the same order, or values supplied to Pipeline.run(). Bump version
+    whenever the stage's output for the same input changes.
+    """
+    name: str
+    func: Callable[..., Awaitable[Any]]
+    inputs: Sequence[str] = ()
+    timeout: Optional[float] = None
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    concurrency: Optional[int] = None
+    cache: bool = False
+    version: str = "1"
+
+    def __post_init__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency) if self.concurrency else None
+
+
+class StageError(Exception):
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {type(cause).__name__}: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+
+@dataclass
+class PipelineResult:
+    outputs: Dict[str, Any]
+    timings: Dict[str, dict]
+
+
+class Pipeline:
+    """
+    Runs a DAG of async stages, starting each one as soon as its inputs are
+    ready so independent stages overlap.
+    """
+
+    def __init__(self, stages: Sequence[Stage], cache_size: int = 1024, cache_ttl: float = 3600):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        self.external_inputs = {
+            name for stage in stages for name in stage.inputs if name not in self.stages
+        }
+        self.order = self._topological_order()
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.stage_versions = {stage.name: stage.version for stage in self.order}
+        self.version = hashlib.sha1(
+            ",".join(f"{name}={version}" for name, version in sorted(self.stage_versions.items())).encode()
+        ).hexdigest()[:12]
+
+    def _topological_order(self) -> list:
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a cycle through stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].inputs:
+                if dep in self.stages:
+                    visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(self.stages[name])
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def stale_stages(self, versions: Dict[str, str]) -> set:
+        """
+        Stages whose output recorded under versions is out of date: their own
+        version changed, or a stage they read from is stale.
+        """
+        stale = set()
+        for stage in self.order:
+            if versions.get(stage.name) != stage.version or any(dep in stale for dep in stage.inputs):
+                stale.add(stage.name)
+        return stale
+
+    async def run(
+        self,
+        inputs: Dict[str, Any],
+        cache_key: Optional[str] = None,
+        on_stage: Optional[Callable[[str, bool, dict], None]] = None,
+        reuse: Optional[Dict[str, Any]] = None,
+    ) -> PipelineResult:
+        """
+        Executes every stage. cache_key identifies the input content (e.g. a
+        file hash); stages with cache=True reuse outputs recorded under it.
+        on_stage(name, succeeded, timing) is called as each stage finishes.
+        reuse maps stage names to previously computed outputs that are
+        returned as-is instead of running the stage.
+        """
+        missing = self.external_inputs - inputs.keys()
+        if missing:
+            raise ValueError(f"Missing pipeline inputs: {', '.join(sorted(missing))}")
+
+        timings: Dict[str, dict] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        for stage in self.order:
+            tasks[stage.name] = asyncio.create_task(
+                self._run_stage(stage, tasks, inputs, cache_key, timings, on_stage, reuse or {})
+            )
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        return PipelineResult(
+            outputs={name: task.result() for name, task in tasks.items()},
+            timings=timings,
+        )
+
+    async def _run_stage(self, stage: Stage, tasks, inputs, cache_key, timings, on_stage, reuse):
+        succeeded = False
+        try:
+            if stage.name in reuse:
+                timings[stage.name] = {'seconds': 0.0, 'attempts': 0, 'cached': True}
+                result = reuse[stage.name]
+            else:
+                result = await self._execute_stage(stage, tasks, inputs, cache_key, timings)
+            succeeded = True
+            return result
+        finally:
+            timing = timings.get(stage.name)
+            if timing is not None:
+                outcome = 'cached' if timing['cached'] else 'ok' if succeeded else 'error'
+                STAGE_SECONDS.observe(timing['seconds'], stage.name, outcome)
+                if on_stage is not None:
+                    on_stage(stage.name, succeeded, timing)
+
+    async def _execute_stage(self, stage: Stage, tasks, inputs, cache_key, timings):
+        args = [
+            await tasks[name] if name in self.stages else inputs[name]
+            for name in stage.inputs
+        ]
+
+        key = (stage.name, stage.version, cache_key)
+        if stage.cache and cache_key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                timings[stage.name] = {'seconds': 0.0, 'attempts': 0, 'cached': True}
+                return cached
+
+        started = time.perf_counter()
+        for attempt in range(1, stage.retry.attempts + 1):
+            try:
+                result = await self._call(stage, args)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt >= stage.retry.attempts:
+                    timings[stage.name] = {
+                        'seconds': round(time.perf_counter() - started, 4),
+                        'attempts': attempt,
+                        'cached': False,
+                    }
+                    raise StageError(stage.name, e) from e
+                delay = stage.retry.delay(attempt)
+                logger.warning("Stage %s attempt %d failed, retrying in %.2fs: %s", stage.name, attempt, delay, e)
+                await asyncio.sleep(delay)
+
+        timings[stage.name] = {
+            'seconds': round(time.perf_counter() - started, 4),
+            'attempts': attempt,
+            'cached': False,
+        }
+        if stage.cache and cache_key is not None:
+            self.cache.set(key, result)
+        return result
+
+    async def _call(self, stage: Stage, args: list):
+        if stage._semaphore is None:
+            return await asyncio.wait_for(stage.func(*args), timeout=stage.timeout)
+        async with stage._semaphore:
+            return await asyncio.wait_for(stage.func(*args), timeout=stage.timeout)
@@ -1,6 +1,30 @@
+import time
+
 from backend.prisma_client import Prisma
+from backend.instrumentation import DB_QUERY_SECONDS
+
+
+class InstrumentedPrisma(Prisma):
+    """
+    Times every query. Model actions, raw queries and transactions (which
+    copy the client) all go through _execute, a private method whose
+    signature is only known for the prisma version pinned in requirements.txt.
+    """
+
+    __slots__ = ()
+
+    async def _execute(self, *, method, arguments, model=None, root_selection=None):
+        started = time.perf_counter()
+        try:
+            return await super()._execute(
+                method=method, arguments=arguments, model=model, root_selection=root_selection
+            )
+        finally:
+            operation = f"{model.__name__}.{method}" if model is not None else method
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, operation)
+
 
-db = Prisma(auto_register=True)
+db = InstrumentedPrisma(auto_register=True)
 
 async def get_db():
     if not db.is_connected():
@@ -0,0 +1,59 @@
+"""
+Re-analyzes stored documents whose analysis predates the current pipeline
+version, re-running only the stages whose version changed:
+
+    python -m backend.reanalyze [--rate 1] [--concurrency 2] [--batch-size 100]
+
+Progress is checkpointed after every batch; running the command again
+resumes an interrupted backfill.
+"""
+import argparse
+import asyncio
+from pathlib import Path
+from dotenv import load_dotenv
+
+env_path = Path(__file__).parent / '.env'
+if not env_path.exists():
+    env_path = Path(__file__).parent.parent / '.env'
+load_dotenv(dotenv_path=env_path, override=True)
+
+from backend.prisma_db import db
+from backend.executors import cpu_executor
+from backend.backfill import (
+    BACKFILL_BATCH_SIZE, BACKFILL_CONCURRENCY, BACKFILL_RATE, backfill_runner,
+)
+
+
+def print_progress(stats: dict) -> None:
+    done = stats['processed'] + stats['failed']
+    percent = 100 * done / stats['total'] if stats['total'] else 100.0
+    eta = f"{stats['eta_seconds'] // 60}m{stats['eta_seconds'] % 60:02d}s" if stats['eta_seconds'] is not None else "?"
+    print(
+        f"{done}/{stats['total']} ({percent:.1f}%), {stats['failed']} failed, "
+        f"{stats['docs_per_second']:.2f} docs/s, ETA {eta}, last id {stats['last_document_id']}"
+    )
+
+
+async def reanalyze(rate: float, concurrency: int, batch_size: int) -> dict:
+    await db.connect()
+    try:
+        return await backfill_runner.run(
+            rate=rate, concurrency=concurrency, batch_size=batch_size, on_progress=print_progress,
+        )
+    finally:
+        cpu_executor.shutdown()
+        await db.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=BACKFILL_RATE, help="documents started per second, 0 for no limit")
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+    stats = asyncio.run(reanalyze(args.rate, args.concurrency, args.batch_size))
+    print(f"✓ Backfill {stats['status']}: {stats['processed']} re-analyzed, {stats['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
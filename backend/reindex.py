@@ -0,0 +1,80 @@
+"""
+Rebuilds the data derived from finished analyses (search index, clinical
+timeline) for documents that already exist:
+
+    python -m backend.reindex [--batch-size 200] [--after-id 0]
+
+Analyses stored as JSON-encoded strings by older versions are first
+rewritten as native JSON. Documents are then walked in id order, so an
+interrupted run can be resumed with --after-id set to the last id it
+printed.
+"""
+import argparse
+import asyncio
+from pathlib import Path
+from dotenv import load_dotenv
+
+env_path = Path(__file__).parent / '.env'
+if not env_path.exists():
+    env_path = Path(__file__).parent.parent / '.env'
+load_dotenv(dotenv_path=env_path, override=True)
+
+from backend.prisma_db import db
+from backend.jobs import record_analysis
+
+_UNWRAP_SQL = """
+UPDATE {table} SET {column} = ({column} #>> '{{}}')::jsonb
+WHERE ctid IN (
+    SELECT ctid FROM {table} WHERE jsonb_typeof({column}) = 'string' LIMIT $1
+)
+"""
+
+
+async def unwrap_legacy_json(batch_size: int) -> int:
+    total = 0
+    for table, column in (("medical_documents", "ai_analysis_json"), ("analysis_cache", "result")):
+        sql = _UNWRAP_SQL.format(table=table, column=column)
+        while True:
+            count = await db.execute_raw(sql, batch_size)
+            total += count
+            if count < batch_size:
+                break
+    return total
+
+
+async def reindex(batch_size: int, after_id: int) -> int:
+    await db.connect()
+    processed = 0
+    try:
+        unwrapped = await unwrap_legacy_json(batch_size)
+        if unwrapped:
+            print(f"Rewrote {unwrapped} JSON-encoded analyses as native JSON")
+        while True:
+            documents = await db.medicaldocument.find_many(
+                where={'id': {'gt': after_id}, 'analysis_status': 'processed'},
+                order={'id': 'asc'},
+                take=batch_size,
+            )
+            if not documents:
+                break
+            for document in documents:
+                await record_analysis(db, document.id, document.patient_id, document.ai_analysis_json)
+            processed += len(documents)
+            after_id = documents[-1].id
+            print(f"Reindexed {processed} documents (last id {after_id})")
+    finally:
+        await db.disconnect()
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--after-id", type=int, default=0)
+    args = parser.parse_args()
+    total = asyncio.run(reindex(args.batch_size, args.after_id))
+    print(f"✓ Reindexed {total} documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import asyncio
+import mimetypes
+from pathlib import Path
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from PIL import Image, UnidentifiedImageError
+except ImportError:  # Pillow is optional; without it no renditions are made.
+    Image = None
+
+RENDITION_SIZES = {
+    "thumbnail": (int(os.getenv("THUMBNAIL_SIZE", "256")),) * 2,
+    "preview": (int(os.getenv("PREVIEW_SIZE", "1280")),) * 2,
+}
+RENDITION_QUALITY = int(os.getenv("RENDITION_QUALITY", "80"))
+RENDITION_TIMEOUT_SECONDS = float(os.getenv("RENDITION_TIMEOUT_SECONDS", "60"))
+
+
+def rendition_path(original: Path, kind: str) -> Path:
+    """Renditions live next to the file they were made from."""
+    return original.with_name(f"{original.name}.{kind}.jpg")
+
+
+def supported(filename: str) -> bool:
+    mime_type = mimetypes.guess_type(filename)[0] or ""
+    return Image is not None and mime_type.startswith("image/")
+
+
+def _render(original: Path, kinds) -> dict:
+    made = {}
+    kinds = sorted(kinds, key=lambda kind: RENDITION_SIZES[kind][0], reverse=True)
+    with Image.open(original) as image:
+        # draft() lets JPEG decoding skip straight to a reduced scale; the
+        # largest requested size bounds it.
+        image.draft("RGB", RENDITION_SIZES[kinds[0]])
+        rgb = image.convert("RGB")
+    for kind in kinds:
+        copy = rgb.copy()
+        copy.thumbnail(RENDITION_SIZES[kind])
+        target = rendition_path(original, kind)
+        temp = target.with_name(target.name + ".part")
+        copy.save(temp, "JPEG", quality=RENDITION_QUALITY, optimize=True)
+        os.replace(temp, target)
+        made[kind] = {"width": copy.width, "height": copy.height}
+    return made
+
+
+def _make(original: Path, kinds) -> Optional[dict]:
+    try:
+        return _render(original, kinds)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+        return None
+
+
+async def create_renditions(file_path: str) -> dict:
+    """
+    Pipeline stage: writes every rendition for an image, off the event loop.
+    Files Pillow can't decode (PDFs, DICOM, ...) are reported as skipped.
+
+    Renditions are cosmetic, so running out of time skips them too rather
+    than failing the analysis; ensure_rendition() makes them on demand.
+    """
+    if Image is None:
+        return {"skipped": "Pillow not installed"}
+    try:
+        made = await asyncio.wait_for(
+            run_in_threadpool(_make, Path(file_path), tuple(RENDITION_SIZES)),
+            timeout=RENDITION_TIMEOUT_SECONDS,
+        )
+    except asyncio.TimeoutError:
+        return {"skipped": "timed out"}
+    if made is None:
+        return {"skipped": "unsupported file type"}
+    return made
+
+
+async def ensure_rendition(original: Path, kind: str) -> Optional[Path]:
+    """
+    Returns the rendition's path, regenerating it if it has gone missing.
+    None if the file can't be rendered.
+    """
+    if Image is None or kind not in RENDITION_SIZES:
+        return None
+    target = rendition_path(original, kind)
+    if await run_in_threadpool(target.exists):
+        return target
+    made = await run_in_threadpool(_make, original, (kind,))
+    return target if made else None
+
+
+def remove_renditions(original: Path) -> None:
+    for kind in RENDITION_SIZES:
+        rendition_path(original, kind).unlink(missing_ok=True)
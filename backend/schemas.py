@@ -24,6 +24,10 @@ class UserInDB(BaseModel):
 class User(UserInDB):
     pass
 
+class PatientSummary(User):
+    document_count: int = 0
+    latest_upload: Optional[datetime] = None
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -38,10 +42,47 @@ class DocumentInfo(BaseModel):
     filename: str
     upload_timestamp: datetime
     ai_analysis: Optional[Dict[str, Any]]
+    analysis_status: str = "processed"
 
     class Config:
         from_attributes = True
 
 class DocumentDetail(DocumentInfo):
     file_url: str
-    analysis_status: str = "processed"
+    renditions: Dict[str, str] = {}
+
+class DocumentSummary(BaseModel):
+    id: int
+    filename: str
+    upload_timestamp: Optional[datetime] = None
+    analysis_status: str
+
+class BatchUploadItem(BaseModel):
+    filename: str
+    id: Optional[int] = None
+    upload_timestamp: Optional[datetime] = None
+    analysis_status: str
+    error: Optional[str] = None
+
+class SearchHit(BaseModel):
+    document_id: int
+    patient_id: int
+    filename: str
+    upload_timestamp: Optional[datetime] = None
+    rank: Optional[float] = None
+    highlight: Optional[str] = None
+
+class TimelineEntry(BaseModel):
+    id: int
+    document_id: int
+    entity_type: str
+    value: str
+    observed_at: datetime
+
+class TimelineAggregate(BaseModel):
+    entity_type: str
+    value: str
+    first_seen: datetime
+    last_seen: datetime
+    occurrences: int
+    document_count: int
@@ -0,0 +1,102 @@
+from typing import Optional
+
+from backend.prisma_client import Prisma
+from backend.documents import parse_analysis
+
+# Prisma can't express these, so they are created (idempotently) at startup.
+# Rows indexed before search_vector was stored get it filled in first; the
+# expression index it replaces is dropped.
+_INDEX_DDL = (
+    "UPDATE document_search SET search_vector = to_tsvector('english', body) "
+    "WHERE search_vector IS NULL",
+    "DROP INDEX IF EXISTS idx_document_search_fts",
+    "CREATE INDEX IF NOT EXISTS idx_document_search_vector "
+    "ON document_search USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS idx_document_search_entities "
+    "ON document_search USING GIN (entities)",
+)
+
+# The body is tokenized once here, so matching and ranking read the stored
+# search_vector instead of re-parsing every matching body.
+_UPSERT_SQL = """
+INSERT INTO document_search (document_id, patient_id, body, search_vector, entities, updated_at)
+VALUES ($1, $2, $3, to_tsvector('english', $3), $4::text[], now())
+ON CONFLICT (document_id) DO UPDATE
+SET patient_id = EXCLUDED.patient_id, body = EXCLUDED.body,
+    search_vector = EXCLUDED.search_vector, entities = EXCLUDED.entities, updated_at = now()
+"""
+
+# Ranks and pages in the inner query; ts_headline, the expensive part, only
+# runs for the rows on the page.
+_SEARCH_SQL = """
+WITH hits AS (
+    SELECT s.document_id, s.patient_id, s.body,
+           ts_rank(s.search_vector, websearch_to_tsquery('english', $2)) AS rank
+    FROM document_search s
+    WHERE s.patient_id = ANY($1::int[])
+      AND ($2::text IS NULL OR s.search_vector @@ websearch_to_tsquery('english', $2))
+      AND ($3::text IS NULL OR s.entities @> ARRAY[$3::text])
+    ORDER BY rank DESC NULLS LAST, s.document_id DESC
+    LIMIT $4 OFFSET $5
+)
+SELECT h.document_id, h.patient_id, h.rank,
+       COALESCE(d.filename, regexp_replace(d.file_path, '^.*/', '')) AS filename,
+       d.upload_timestamp,
+       CASE WHEN $2::text IS NULL THEN NULL
+            ELSE ts_headline('english', h.body, websearch_to_tsquery('english', $2),
+                             'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5')
+       END AS highlight
+FROM hits h
+JOIN medical_documents d ON d.id = h.document_id
+ORDER BY h.rank DESC NULLS LAST, h.document_id DESC
+"""
+
+
+async def ensure_indexes(db: Prisma) -> None:
+    for ddl in _INDEX_DDL:
+        await db.execute_raw(ddl)
+
+
+def entity_key(value: str, label: Optional[str] = None) -> str:
+    value = value.strip().lower()
+    return f"{label.strip().lower()}:{value}" if label else value
+
+
+def extract(analysis: dict) -> tuple:
+    """
+    Searchable body text and entity keys for an analysis result. Each entity
+    is indexed both bare ("amoxicillin") and with its label
+    ("medication:amoxicillin").
+    """
+    nlp = analysis.get("nlp_result") or {}
+    entities = [entity for entity in nlp.get("entities") or [] if entity.get("text")]
+    parts = [
+        analysis.get("ocr_result") or "",
+        nlp.get("summary") or "",
+        " ".join(entity["text"] for entity in entities),
+    ]
+    keys = set()
+    for entity in entities:
+        keys.add(entity_key(entity["text"]))
+        if entity.get("label"):
+            keys.add(entity_key(entity["text"], entity["label"]))
+    return "\n".join(part for part in parts if part), sorted(keys)
+
+
+async def index_document(db: Prisma, document_id: int, patient_id: Optional[int], analysis) -> None:
+    analysis = parse_analysis(analysis)
+    if analysis is None or patient_id is None:
+        return
+    body, entities = extract(analysis)
+    await db.execute_raw(_UPSERT_SQL, document_id, patient_id, body, entities)
+
+
+async def search(db: Prisma, patient_ids, query: Optional[str], entity: Optional[str],
+                 limit: int, offset: int) -> list:
+    """
+    Searches the documents of the given patients, normally a doctor's
+    linked patients from patient_links.
+    """
+    if not patient_ids:
+        return []
+    return await db.query_raw(_SEARCH_SQL, sorted(patient_ids), query, entity, limit, offset)
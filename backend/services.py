@@ -1,21 +1,50 @@
+import os
+import time
 import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Optional
 
-async def mock_ocr_service(file_path: str) -> str:
-    """
-    Simulates an OCR service that extracts text from a file.
-    """
-    print(f"Starting OCR for {file_path}")
-    await asyncio.sleep(1)
-    print(f"Finished OCR for {file_path}")
-    return "Patient prescribed Amoxicillin 500mg for a bacterial infection. Follow up in 1 week."
+from backend.pipeline import Pipeline, RetryPolicy, Stage
+from backend.executors import cpu_executor
+from backend.batching import MicroBatcher
+from backend import metrics
+from backend.renditions import create_renditions
 
-async def mock_nlp_service(text: str) -> dict:
+# "mock" keeps the sleep-based services; "local" runs the CPU models in
+# backend/inference.py on the process pool.
+ANALYSIS_BACKEND = os.getenv("ANALYSIS_BACKEND", "mock")
+
+NLP_BATCH_SIZE = int(os.getenv("NLP_BATCH_SIZE", "16"))
+NLP_BATCH_WAIT_MS = float(os.getenv("NLP_BATCH_WAIT_MS", "20"))
+CV_BATCH_SIZE = int(os.getenv("CV_BATCH_SIZE", "8"))
+CV_BATCH_WAIT_MS = float(os.getenv("CV_BATCH_WAIT_MS", "20"))
+
+# Simulated latency of the mock services, e.g. 0 to benchmark everything
+# around them.
+MOCK_OCR_SECONDS = float(os.getenv("MOCK_OCR_SECONDS", "1"))
+MOCK_NLP_SECONDS = float(os.getenv("MOCK_NLP_SECONDS", "1.5"))
+MOCK_CV_SECONDS = float(os.getenv("MOCK_CV_SECONDS", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _timed(service: str, **fields):
     """
-    Simulates an NLP service that extracts entities and a summary from text.
+    Logs a service call's start at DEBUG and its duration at INFO.
     """
-    print("Starting NLP processing")
-    await asyncio.sleep(1.5)
-    print("Finished NLP processing")
+    logger.debug("%s started", service, extra={'service': service, **fields})
+    started = time.perf_counter()
+    yield
+    logger.info("%s finished", service, extra={
+        'service': service,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        **fields,
+    })
+
+
+def _mock_nlp_result() -> dict:
     return {
         "summary": "The patient was prescribed Amoxicillin for a bacterial infection.",
         "entities": [
@@ -25,15 +54,154 @@ async def mock_nlp_service(text: str) -> dict:
         ],
     }
 
+def _mock_cv_result() -> dict:
+    return {
+        "classification": "Pneumonia Detected",
+        "confidence": 0.92,
+        "heatmap_url": "path/to/mock_heatmap.png",
+    }
+
+async def mock_ocr_service(file_path: str) -> str:
+    """
+    Simulates an OCR service that extracts text from a file.
+    """
+    with _timed("mock_ocr", file_path=file_path):
+        await asyncio.sleep(MOCK_OCR_SECONDS)
+    return "Patient prescribed Amoxicillin 500mg for a bacterial infection. Follow up in 1 week."
+
+async def mock_nlp_service(text: str) -> dict:
+    """
+    Simulates an NLP service that extracts entities and a summary from text.
+    """
+    with _timed("mock_nlp"):
+        await asyncio.sleep(MOCK_NLP_SECONDS)
+    return _mock_nlp_result()
+
 async def mock_cv_service(file_path: str) -> dict:
     """
     Simulates a Computer Vision service for medical image analysis.
     """
-    print(f"Starting CV analysis for {file_path}")
-    await asyncio.sleep(2)
-    print(f"Finished CV analysis for {file_path}")
+    with _timed("mock_cv", file_path=file_path):
+        await asyncio.sleep(MOCK_CV_SECONDS)
+    return _mock_cv_result()
+
+async def mock_nlp_batch_service(texts: list) -> list:
+    """
+    Simulates batched NLP inference: one model call for the whole list.
+    """
+    with _timed("mock_nlp_batch", batch_size=len(texts)):
+        await asyncio.sleep(MOCK_NLP_SECONDS)
+    return [_mock_nlp_result() for _ in texts]
+
+async def mock_cv_batch_service(file_paths: list) -> list:
+    """
+    Simulates batched Computer Vision inference over several images.
+    """
+    with _timed("mock_cv_batch", batch_size=len(file_paths)):
+        await asyncio.sleep(MOCK_CV_SECONDS)
+    return [_mock_cv_result() for _ in file_paths]
+
+nlp_batcher = MicroBatcher(mock_nlp_batch_service, NLP_BATCH_SIZE, NLP_BATCH_WAIT_MS, name="nlp")
+cv_batcher = MicroBatcher(mock_cv_batch_service, CV_BATCH_SIZE, CV_BATCH_WAIT_MS, name="cv")
+metrics.register("nlp_batcher", nlp_batcher.stats)
+metrics.register("cv_batcher", cv_batcher.stats)
+
+async def batched_nlp_service(text: str) -> dict:
+    """
+    Single-item NLP call that is coalesced with concurrent calls into one batch.
+    """
+    return await nlp_batcher.submit(text)
+
+async def batched_cv_service(file_path: str) -> dict:
+    """
+    Single-item CV call that is coalesced with concurrent calls into one batch.
+    """
+    return await cv_batcher.submit(file_path)
+
+async def local_ocr_service(file_path: str) -> str:
+    """
+    Runs the local OCR model on the CPU process pool.
+    """
+    return await cpu_executor.run("ocr", file_path)
+
+async def local_cv_service(file_path: str) -> dict:
+    """
+    Runs the local vision model on the CPU process pool.
+    """
+    return await cpu_executor.run("cv", file_path)
+
+if ANALYSIS_BACKEND == "local":
+    ocr_service, cv_service = local_ocr_service, local_cv_service
+else:
+    ocr_service, cv_service = mock_ocr_service, batched_cv_service
+
+ANALYSIS_PIPELINE = Pipeline([
+    Stage(
+        "ocr", ocr_service, inputs=("file_path",),
+        timeout=60, retry=RetryPolicy(attempts=2), concurrency=8, cache=True, version="1",
+    ),
+    Stage(
+        "nlp", batched_nlp_service, inputs=("ocr",),
+        timeout=60, retry=RetryPolicy(attempts=2), concurrency=NLP_BATCH_SIZE * 2, cache=True, version="1",
+    ),
+    Stage(
+        "cv", cv_service, inputs=("file_path",),
+        timeout=120, retry=RetryPolicy(attempts=2), concurrency=CV_BATCH_SIZE * 2, cache=True, version="1",
+    ),
+    Stage(
+        # No stage timeout: create_renditions enforces its own and reports
+        # a skip, so a slow thumbnail never fails the analysis.
+        "renditions", create_renditions, inputs=("file_path",),
+        concurrency=2, cache=True, version="1",
+    ),
+])
+metrics.register("stage_cache", ANALYSIS_PIPELINE.cache.stats)
+
+# Derived from the stage versions above: bump a stage's version whenever its
+# output changes and cached analyses are recomputed and stored ones become
+# stale for backend/backfill.py.
+PIPELINE_VERSION = ANALYSIS_PIPELINE.version
+
+# Where each stage's output lives in a stored analysis.
+RESULT_KEYS = {
+    "ocr": "ocr_result",
+    "nlp": "nlp_result",
+    "cv": "cv_result",
+    "renditions": "renditions",
+}
+
+
+def stale_stages(previous: Optional[dict]) -> set:
+    """
+    Stages that have to be re-run to bring a stored analysis up to date.
+    """
+    versions = (previous or {}).get("stage_versions") or {}
+    return ANALYSIS_PIPELINE.stale_stages(versions)
+
+
+async def analyze_document(
+    file_path: str, content_hash: Optional[str] = None, on_stage=None,
+    previous: Optional[dict] = None,
+) -> dict:
+    """
+    Runs the analysis pipeline for a stored file and aggregates the results.
+
+    Given a previous analysis of the same file, only the stages whose
+    version changed since (and the stages downstream of them) are re-run.
+    """
+    reuse = {}
+    if previous is not None:
+        stale = stale_stages(previous)
+        reuse = {
+            name: previous[key] for name, key in RESULT_KEYS.items()
+            if name not in stale and key in previous
+        }
+    result = await ANALYSIS_PIPELINE.run(
+        {"file_path": file_path}, cache_key=content_hash, on_stage=on_stage, reuse=reuse
+    )
     return {
-        "classification": "Pneumonia Detected",
-        "confidence": 0.92,
-        "heatmap_url": "path/to/mock_heatmap.png",
+        **{key: result.outputs[name] for name, key in RESULT_KEYS.items()},
+        "stage_timings": result.timings,
+        "pipeline_version": PIPELINE_VERSION,
+        "stage_versions": dict(ANALYSIS_PIPELINE.stage_versions),
     }
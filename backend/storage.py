@@ -0,0 +1,303 @@
+import os
+import stat
+import uuid
+import shutil
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from backend.renditions import remove_renditions
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 is only needed for STORAGE_BACKEND=s3.
+    boto3 = None
+
+# "local" keeps files under UPLOAD_DIR; "s3" uses any S3-compatible service
+# (AWS, MinIO, ...), with S3_ENDPOINT_URL set for anything but AWS.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "./uploads"))
+
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", str(16 * 1024 * 1024)))
+S3_MAX_CONNECTIONS = int(os.getenv("S3_MAX_CONNECTIONS", "32"))
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+# Local copies of objects for analysis and renditions, evicted least recently
+# used first beyond STORAGE_CACHE_MAX_BYTES (0 for no limit); copies are
+# fetched again on demand.
+STORAGE_CACHE_DIR = Path(os.getenv("STORAGE_CACHE_DIR", str(UPLOAD_DIR / "cache")))
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+@dataclass
+class ObjectInfo:
+    size: int
+    mtime: float
+
+
+def _copy_into(source: Path, target: Path, move: bool) -> None:
+    if target.exists():
+        if move:
+            source.unlink(missing_ok=True)
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if move:
+        os.replace(source, target)
+        return
+    temp = target.with_name(f"{target.name}.{uuid.uuid4().hex}.part")
+    shutil.copyfile(source, temp)
+    os.replace(temp, target)
+
+
+class LocalStorage:
+    """
+    Files under a root directory. Keys are relative paths; blob keys fan out
+    by hash prefix (ab/cd/abcd...) so no directory grows too large.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """The file itself, for callers that can serve it directly."""
+        return self.root / key
+
+    async def put(self, key: str, source: Path, move: bool = True) -> None:
+        await run_in_threadpool(_copy_into, source, self.root / key, move)
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool((self.root / key).exists)
+
+    async def stat(self, key: str) -> Optional[ObjectInfo]:
+        try:
+            stat = await run_in_threadpool(os.stat, self.root / key)
+        except FileNotFoundError:
+            return None
+        return ObjectInfo(size=stat.st_size, mtime=stat.st_mtime)
+
+    async def delete(self, key: str) -> None:
+        path = self.root / key
+
+        def remove():
+            path.unlink(missing_ok=True)
+            remove_renditions(path)
+
+        await run_in_threadpool(remove)
+
+    @asynccontextmanager
+    async def open_local(self, key: str):
+        yield self.root / key
+
+    async def read_range(self, key: str, first: int, last: int) -> AsyncIterator[bytes]:
+        fd = await run_in_threadpool(os.open, self.root / key, os.O_RDONLY)
+        try:
+            offset = first
+            while offset <= last:
+                chunk = await run_in_threadpool(os.pread, fd, min(READ_CHUNK_SIZE, last - offset + 1), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                yield chunk
+        finally:
+            os.close(fd)
+
+
+def _prune_cache(root: Path, target: int, in_use: set) -> int:
+    """
+    Deletes the least recently modified files under root until the rest fit
+    in target bytes. A file in in_use, its renditions and partial downloads
+    are kept. Returns the bytes left.
+    """
+    files = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = Path(directory, name)
+            try:
+                info = path.stat()
+            except FileNotFoundError:
+                continue
+            if stat.S_ISREG(info.st_mode):
+                files.append((info.st_mtime, info.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= target:
+            break
+        # Renditions and .part files are named after the copy they belong to.
+        if path.with_name(path.name.split(".", 1)[0]) in in_use:
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+    return total
+
+
+def _touch(path: Path) -> bool:
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _missing(error) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+class S3Storage:
+    """
+    Objects in an S3-compatible bucket. One client, and so one connection
+    pool of S3_MAX_CONNECTIONS, is shared by every request; large files go
+    up as multipart uploads of S3_PART_SIZE parts.
+
+    Analysis and renditions need a file on disk, so open_local() keeps a
+    local copy of an object under STORAGE_CACHE_DIR. Once the copies pass
+    cache_max_bytes, the least recently used are deleted down to 90% of it.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, part_size: int = S3_PART_SIZE,
+                 max_connections: int = S3_MAX_CONNECTIONS, cache_dir: Path = STORAGE_CACHE_DIR,
+                 cache_max_bytes: int = STORAGE_CACHE_MAX_BYTES):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        # Bytes under cache_dir as of the last prune plus downloads since;
+        # None until the first prune has measured it.
+        self._cache_bytes: Optional[int] = None
+        self._pruning = False
+        # Copies open_local() has handed out, which eviction leaves alone.
+        self._in_use: dict = {}
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(max_pool_connections=max_connections, retries={"mode": "standard"}),
+        )
+        self.transfer = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=S3_UPLOAD_CONCURRENCY,
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None
+
+    async def put(self, key: str, source: Path, move: bool = True) -> None:
+        if not await self.exists(key):
+            await run_in_threadpool(
+                self.client.upload_file, str(source), self.bucket, self._key(key), Config=self.transfer
+            )
+        if move:
+            await run_in_threadpool(source.unlink, True)
+
+    async def stat(self, key: str) -> Optional[ObjectInfo]:
+        try:
+            head = await run_in_threadpool(self.client.head_object, Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if _missing(e):
+                return None
+            raise
+        return ObjectInfo(size=head["ContentLength"], mtime=head["LastModified"].timestamp())
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    async def delete(self, key: str) -> None:
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=self._key(key))
+        cached = self.cache_dir / key
+
+        def remove():
+            cached.unlink(missing_ok=True)
+            remove_renditions(cached)
+
+        await run_in_threadpool(remove)
+
+    @asynccontextmanager
+    async def open_local(self, key: str):
+        cached = self.cache_dir / key
+        self._in_use[cached] = self._in_use.get(cached, 0) + 1
+        try:
+            # Touching the copy marks it as recently used.
+            if not await run_in_threadpool(_touch, cached):
+                await self._download(key, cached)
+            yield cached
+        finally:
+            self._in_use[cached] -= 1
+            if not self._in_use[cached]:
+                del self._in_use[cached]
+
+    async def _download(self, key: str, cached: Path) -> None:
+        await run_in_threadpool(cached.parent.mkdir, parents=True, exist_ok=True)
+        temp = cached.with_name(f"{cached.name}.{uuid.uuid4().hex}.part")
+        try:
+            await run_in_threadpool(
+                self.client.download_file, self.bucket, self._key(key), str(temp), Config=self.transfer
+            )
+            size = (await run_in_threadpool(os.stat, temp)).st_size
+            await run_in_threadpool(os.replace, temp, cached)
+        except ClientError as e:
+            if _missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+        finally:
+            await run_in_threadpool(temp.unlink, True)
+        if self._cache_bytes is not None:
+            self._cache_bytes += size
+        await self._prune()
+
+    async def _prune(self) -> None:
+        if not self.cache_max_bytes or self._pruning:
+            return
+        if self._cache_bytes is not None and self._cache_bytes <= self.cache_max_bytes:
+            return
+        self._pruning = True
+        try:
+            self._cache_bytes = await run_in_threadpool(
+                _prune_cache, self.cache_dir, self.cache_max_bytes * 9 // 10, set(self._in_use)
+            )
+        finally:
+            self._pruning = False
+
+    async def read_range(self, key: str, first: int, last: int) -> AsyncIterator[bytes]:
+        response = await run_in_threadpool(
+            self.client.get_object, Bucket=self.bucket, Key=self._key(key), Range=f"bytes={first}-{last}"
+        )
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await run_in_threadpool(body.read, READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+
+def create_storage():
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION)
+    if STORAGE_BACKEND != "local":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'")
+    return LocalStorage(UPLOAD_DIR)
+
+
+storage = create_storage()
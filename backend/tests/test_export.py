@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+export = pytest.importorskip("backend.export")
+
+
+# Shaped like db.query_raw rows, which carry timestamps as ISO strings.
+def _row(**fields) -> dict:
+    row = {
+        'id': 7,
+        'filename': "scan.png",
+        'upload_timestamp': "2024-03-05T14:30:00+00:00",
+        'analysis_status': "processed",
+        'ai_analysis': json.dumps({
+            "nlp_result": {"summary": "Fine.", "entities": [{"text": "aspirin", "label": "DRUG"}]},
+            "cv_result": {"classification": "Normal", "confidence": 0.9},
+            "pipeline_version": "v2",
+        }),
+    }
+    row.update(fields)
+    return row
+
+
+def test_zip_info_takes_raw_query_timestamps():
+    timestamp = export._timestamp(_row()['upload_timestamp'])
+    info = export._zip_info("files/7-scan.png", timestamp, export.zipfile.ZIP_STORED)
+    assert info.date_time == (2024, 3, 5, 14, 30, 0)
+
+
+def test_csv_row_takes_raw_query_timestamps():
+    row = export._csv_row(_row(), "files/7-scan.png")
+    assert row[2] == "2024-03-05T14:30:00+00:00"
+    assert row[5:] == ["Fine.", "Normal", 0.9, "aspirin (DRUG)", "v2"]
+
+
+def test_csv_row_without_timestamp():
+    row = export._csv_row(_row(upload_timestamp=None), "")
+    assert row[2] == ""
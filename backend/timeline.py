@@ -0,0 +1,86 @@
+from typing import Optional
+
+from fastapi import Response
+
+from backend.prisma_client import Prisma
+from backend.documents import decode_cursor, encode_cursor, parse_analysis
+
+# Replaces a document's entities in one statement so re-analysis never
+# leaves duplicates. observed_at is the document's upload time.
+_REPLACE_SQL = """
+WITH cleared AS (
+    DELETE FROM clinical_entities WHERE document_id = $1
+)
+INSERT INTO clinical_entities (patient_id, document_id, entity_type, value, normalized, observed_at)
+SELECT d.patient_id, d.id, e.entity_type, e.value, e.normalized,
+       COALESCE(d.upload_timestamp, now())
+FROM medical_documents d,
+     unnest($2::text[], $3::text[], $4::text[]) AS e(entity_type, value, normalized)
+WHERE d.id = $1 AND d.patient_id IS NOT NULL
+"""
+
+# Oldest first, paged on (observed_at, id) like the document summaries.
+_ENTRIES_SQL = """
+SELECT id, document_id, entity_type, value, observed_at, observed_at::text AS cursor_ts
+FROM clinical_entities
+WHERE patient_id = $1
+  AND ($2::text IS NULL OR entity_type = $2)
+  AND ($3::timestamptz IS NULL OR (observed_at, id) > ($3::timestamptz, $4::int))
+ORDER BY observed_at, id
+LIMIT $5
+"""
+
+_AGGREGATE_SQL = """
+SELECT entity_type,
+       MIN(value) AS value,
+       MIN(observed_at) AS first_seen,
+       MAX(observed_at) AS last_seen,
+       COUNT(*)::int AS occurrences,
+       COUNT(DISTINCT document_id)::int AS document_count
+FROM clinical_entities
+WHERE patient_id = $1
+  AND ($2::text IS NULL OR entity_type = $2)
+GROUP BY entity_type, normalized
+ORDER BY entity_type, MAX(observed_at) DESC
+"""
+
+
+def normalize(value: str) -> str:
+    return " ".join(value.lower().split())
+
+
+async def record_entities(db: Prisma, document_id: int, analysis) -> None:
+    analysis = parse_analysis(analysis)
+    if analysis is None:
+        return
+    entities = [
+        entity for entity in (analysis.get("nlp_result") or {}).get("entities") or []
+        if entity.get("text") and entity.get("label")
+    ]
+    await db.execute_raw(
+        _REPLACE_SQL,
+        document_id,
+        [entity["label"].upper()[:32] for entity in entities],
+        [entity["text"][:255] for entity in entities],
+        [normalize(entity["text"])[:255] for entity in entities],
+    )
+
+
+async def list_entries(
+    db: Prisma, response: Response, patient_id: int, entity_type: Optional[str],
+    cursor: Optional[str], limit: int
+) -> list:
+    """
+    Returns one page of a patient's timeline and sets X-Next-Cursor when
+    more remain.
+    """
+    timestamp, entity_id = decode_cursor(cursor)
+    rows = await db.query_raw(_ENTRIES_SQL, patient_id, entity_type, timestamp, entity_id, limit)
+    if len(rows) == limit:
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last['cursor_ts'], last['id'])
+    return rows
+
+
+async def aggregate(db: Prisma, patient_id: int, entity_type: Optional[str]) -> list:
+    return await db.query_raw(_AGGREGATE_SQL, patient_id, entity_type)
@@ -4,6 +4,7 @@ import '../styles/CodeManagement.css';
 
 const GenerateAccessCode = () => {
   const [accessCode, setAccessCode] = useState('');
+  const [expiresAt, setExpiresAt] = useState(null);
   const [message, setMessage] = useState('');
   const [error, setError] = useState('');
   const [loading, setLoading] = useState(false);
@@ -15,6 +16,7 @@ const GenerateAccessCode = () => {
     try {
       const response = await api.post('/patient/generate-access-code');
       setAccessCode(response.data.access_code);
+      setExpiresAt(response.data.expires_at);
       setMessage('Share this code with your doctor to grant them access.');
     } catch (err) {
       setError(err.response?.data?.detail || 'Failed to generate access code.');
@@ -34,6 +36,14 @@ const GenerateAccessCode = () => {
         <div className="access-code-display">
           <p>{message}</p>
           <strong>{accessCode}</strong>
+          {expiresAt && (
+            <p className="access-code-expiry">
+              Valid until {new Date(expiresAt).toLocaleString('en-US', {
+                dateStyle: 'medium',
+                timeStyle: 'short'
+              })}
+            </p>
+          )}
         </div>
       )}
       {error && <p className="error-message">{error}</p>}
@@ -4,6 +4,8 @@ import api from '../services/api.js';
 import '../styles/DoctorDashboard.css';
 import LinkPatient from '../components/LinkPatient.jsx';
 
+const PATIENT_PAGE_SIZE = 50;
+
 const DoctorDashboard = () => {
     const { token, user } = useAuth();
     const [patients, setPatients] = useState([]);
@@ -11,24 +13,50 @@ const DoctorDashboard = () => {
     const [documents, setDocuments] = useState([]);
     const [error, setError] = useState('');
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [search, setSearch] = useState('');
+
+    const fetchPatientPage = useCallback(async (cursor) => {
+        const params = { limit: PATIENT_PAGE_SIZE };
+        if (cursor) params.cursor = cursor;
+        if (search.trim()) params.search = search.trim();
+        const response = await api.get('/doctor/patients', { params });
+        setNextCursor(response.headers['x-next-cursor'] || null);
+        return response.data;
+    }, [search]);
 
     const fetchPatients = useCallback(async () => {
         try {
             setLoading(true);
-            const response = await api.get('/doctor/patients');
-            setPatients(response.data);
+            setPatients(await fetchPatientPage(null));
         } catch (err) {
             setError('Failed to fetch patients.');
             console.error(err);
         } finally {
             setLoading(false);
         }
-    }, []);
+    }, [fetchPatientPage]);
 
-    useEffect(() => {
-        if (token) {
-            fetchPatients();
+    const loadMorePatients = async () => {
+        if (!nextCursor || loadingMore) return;
+        try {
+            setLoadingMore(true);
+            const page = await fetchPatientPage(nextCursor);
+            setPatients((current) => [...current, ...page]);
+        } catch (err) {
+            setError('Failed to fetch more patients.');
+            console.error(err);
+        } finally {
+            setLoadingMore(false);
         }
+    };
+
+    useEffect(() => {
+        if (!token) return undefined;
+        // Debounced so typing a search prefix doesn't fire a request per key.
+        const timer = setTimeout(fetchPatients, 300);
+        return () => clearTimeout(timer);
     }, [token, fetchPatients]);
 
     const handlePatientSelect = async (patient) => {
@@ -54,7 +82,7 @@ const DoctorDashboard = () => {
                         <div className="stat-card">
                             <div className="stat-icon">Patients</div>
                             <div className="stat-info">
-                                <div className="stat-value">{patients.length}</div>
+                                <div className="stat-value">{patients.length}{nextCursor ? '+' : ''}</div>
                                 <div className="stat-label">Total Patients</div>
                             </div>
                         </div>
@@ -80,9 +108,16 @@ const DoctorDashboard = () => {
                 <div className="patients-list-container">
                     <div className="section-header">
                         <h2>Your Patients</h2>
-                        <span className="patient-count">{patients.length} patient{patients.length !== 1 ? 's' : ''}</span>
+                        <span className="patient-count">{patients.length}{nextCursor ? '+' : ''} patient{patients.length !== 1 ? 's' : ''}</span>
                     </div>
                     <LinkPatient onPatientLinked={fetchPatients} />
+                    <input
+                        type="search"
+                        className="patient-search"
+                        placeholder="Search by name or email"
+                        value={search}
+                        onChange={(e) => setSearch(e.target.value)}
+                    />
                     {loading ? (
                         <div className="loading-container">
                             <div className="spinner"></div>
@@ -106,6 +141,18 @@ const DoctorDashboard = () => {
                                     {selectedPatient?.id === patient.id && <div className="selected-indicator">✓</div>}
                                 </li>
                             ))}
+                            {nextCursor && (
+                                <li className="load-more-item">
+                                    <button
+                                        type="button"
+                                        className="load-more-button"
+                                        onClick={loadMorePatients}
+                                        disabled={loadingMore}
+                                    >
+                                        {loadingMore ? 'Loading...' : 'Load more patients'}
+                                    </button>
+                                </li>
+                            )}
                         </ul>
                     ) : (
                         <div className="empty-state">